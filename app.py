@@ -7,15 +7,55 @@ import streamlit as st
 import weaviate
 import weaviate.classes as wvc
 from session_state import *
+from scripts.fanout import fan_out
+from scripts.fusion import ALPHA, collapse_by_filename, hits_from_objects, merge_hits, rrf_fuse
+from scripts.calibration import RESULTS_PER_COLLECTION, calibrator, top_k
+from scripts.passages import PASSAGE_COLLECTION, aggregate_passages, merge_documents
+from scripts.query_expansion import expansion_vectors, merge_expansions
+from scripts.get_llama_inference import get_llama_inference, is_parsed, llama
+from scripts.preview_cache import preview_cache
+from scripts.blob_store import blob_store
+from scripts.result_cache import result_cache, make_key
+from scripts.manifest import read_generation
+from scripts.projection import ResponseMeter, ResultProjection
+from scripts.query_filters import collections_for_file_types, date_filter, llm_date_range, parse_date
 
 from datetime import datetime, timezone
 import os
+import json
+import subprocess
+import sys
+import time
 from streamlit import session_state as ss
 from streamlit_pdf_viewer import pdf_viewer
 
 
 debug = True
 
+# Address of the query-understanding service started with `python -m scripts.query_server`,
+# e.g. "127.0.0.1:8765". When unset, TinyLlama runs inside the Streamlit process.
+QUERY_SERVER = os.environ.get("QUERY_SERVER")
+
+# Results fetched per collection (cached and paged through) and results shown per page
+RESULT_LIMIT = 100
+PAGE_SIZE = 12
+
+@st.cache_resource
+def get_projection(_client, generation):
+    """
+    Share one result projection, and the collection schemas it reads, across reruns and sessions.
+    A new one is made after every ingestion, which may have re-created collections.
+
+    Args:
+        _client (WeaviateClient): The Weaviate client (not hashed by Streamlit).
+        generation (int): The ingestion generation.
+
+    Returns:
+        ResultProjection: The shared projection.
+    """
+    return ResultProjection(_client)
+
+
 # Define the main application class
 class WeaviateApp:
     """
@@ -34,6 +74,10 @@ class WeaviateApp:
         self.logo_path = Path("assets/logo.jpeg")
         # Initialize an empty list to store the search results
         self.big_response_list = []
+        # Request only metadata properties; media is read from disk when a result is shown
+        self.projection = get_projection(self.client, read_generation())
+        # Estimated response sizes of the current search, shown in debug mode
+        self.meter = ResponseMeter()
 
         self.sort_by = None
         self.filter_by_relevance = None
@@ -41,6 +85,13 @@ class WeaviateApp:
         self.filter_by_date = None
         self.date_before = None
         self.date_after = None
+        self.alpha = ALPHA
+        # Whether the last search produced complete results for the requested mode
+        self.cacheable = True
+
+        # Start loading TinyLlama in the background; the instance is shared by all sessions
+        if not QUERY_SERVER:
+            llama.start()
 
 
     # Function to display the title of the application
@@ -106,6 +157,29 @@ class WeaviateApp:
         date_after = st.text_input('After Date (YYYY-MM-DD)') if filter_by_date else None
         return sort_by, filter_by_relevance, relevance_threshold, filter_by_date, date_before, date_after
 
+    # Function to build the Weaviate filter of a search
+    def build_filters(self, llm_result=None):
+        """
+        Build the filter evaluated by Weaviate from the date options and, for TinyLlama, the extracted dates,
+        so that only matching objects are retrieved and transferred.
+
+        Args:
+            llm_result (dict, optional): The information extracted by TinyLlama. Defaults to None.
+
+        Returns:
+            Filter: The filter on 'date_modified', or None if the search is not restricted by date.
+        """
+        after = before = None
+        if self.filter_by_date:
+            after = parse_date(self.date_after) if self.date_after else None
+            before = parse_date(self.date_before) if self.date_before else None
+        date_range = llm_date_range(llm_result) if isinstance(llm_result, dict) else None
+        if date_range is not None:
+            # Intersect the extracted range with the user's dates
+            after = max(after, date_range[0]) if after else date_range[0]
+            before = min(before, date_range[1]) if before else date_range[1]
+        return date_filter(after, before)
+
     # Function to search by image
     def search_by_image(self, img):
         """
@@ -117,104 +191,200 @@ class WeaviateApp:
         # Convert the image to base64
         imgb64 = base64.b64encode(img.read()).decode()
         # Query the image collection with the image
-        response = img_collection.query.near_image(
+        response = self.meter.measure(
+            'images', img_collection.query.near_image,
             near_image=imgb64,
-            return_properties=["filename"],
+            distance=self.relevance_threshold if self.filter_by_relevance else None,
+            filters=self.build_filters(),
+            return_properties=self.projection.properties('images'),
             return_metadata=wvc.query.MetadataQuery(distance=True),
-            limit=6,
+            limit=RESULT_LIMIT,
         )
         # Extend the big response list with the response objects
-        self.big_response_list.extend(response.objects)
+        self.big_response_list.extend(hits_from_objects(response.objects, 'images'))
 
     # Function to search by text
-    def search_by_text(self, search_text):
+    def search_by_text(self, search_text, llm_model):
         """
-        Search by text. This function defines the collections to search in, gets the collection object from the client,
-        queries the collection with the search text, and extends the big response list with the response objects.
+        Search by text. This function defines the collections to search in, queries all of them concurrently
+        with the search text, and extends the big response list with the response objects of every collection
+        that answered in time. Date and relevance filters are evaluated by Weaviate.
         """
-    def search_by_text(self, search_text,llm_model):
         # Define the collections to search in
         collections = ['images', 'pdf','videos']
         # collections = ['pdf']
+        result = None
 
         if llm_model == 'TinyLlamma':
-                from scripts.get_llama_inference import get_llama_inference
-                result = get_llama_inference(search_text)
+                if QUERY_SERVER:
+                    from scripts.query_server import parse_query
+                    host, port = QUERY_SERVER.rsplit(':', 1)
+                    try:
+                        result = parse_query(search_text, host, int(port))
+                    except (OSError, ValueError, RuntimeError) as e:
+                        # Refused connection, timeout, malformed reply or server-side error
+                        print(f"Query server failed: {e}")
+                        result = None
+                else:
+                    result = get_llama_inference(search_text, wait=False)
+                if not is_parsed(result):
+                    # Fall back to the hybrid search until the model has finished loading, or if it could not
+                    # parse the query (no dict, or a partial one from a truncated generation)
+                    if result is None and not QUERY_SERVER and not llama.ready:
+                        st.info(f"TinyLlama model is not ready ({llama.status}); using Hybrid for this search.")
+                    else:
+                        st.info("TinyLlama could not parse the query; using Hybrid for this search.")
+                    result = None
+                    llm_model = 'Hybrid'
+                    # The results are not the ones the TinyLlama key stands for
+                    self.cacheable = False
+                else:
+                    print(result)
+                    if result.get('day') == [0, 0] and result.get('month') == [0, 0] and result.get('year') == [2024, 2024]:
+                        self.sort_by = 'Date'
+                    # Only search the collections holding the requested file types
+                    collections = collections_for_file_types(result.get('file type'), collections)
+
+        # Also search PDFs through their passages when the passage index exists
+        if 'pdf' in collections and self.client.collections.exists(PASSAGE_COLLECTION):
+            collections = collections + [PASSAGE_COLLECTION]
+
+        filters = self.build_filters(result)
+        # BM25 scores have no distance, so the relevance threshold only applies to vector searches
+        distance = self.relevance_threshold if self.filter_by_relevance else None
+
+        # Hybrid runs keyword and vector retrieval side by side and fuses their rankings
+        modes = {'BM25': ['bm25'], 'Hybrid': ['bm25', 'vector']}.get(llm_model, ['vector'])
+
+        # Embed the query (or all of TinyLlama's synonyms) in one request and reuse the vectors for every collection
+        query_vectors = []
+        concepts = result.get('file content') if llm_model == 'TinyLlamma' else search_text
+        if 'vector' in modes:
+            try:
+                query_vectors = expansion_vectors(concepts)
+            except Exception as e:
+                # Let Weaviate vectorize the query itself if the inference container is unreachable
+                print(f"Query embedding failed, falling back to near_text: {e}")
 
-        for collection in collections:
+        def query_collection(task):
+            collection, mode, i = task
             # Get the collection object from the client
             collection_obj = self.client.collections.get(collection)
             # Query the collection with the search text
-            
-            if llm_model == 'TinyLlamma':
-                response = collection_obj.query.near_text(
-                    query=result['file content'],
-                    # return_properties=["filename"],                           # enable if required
-                    return_metadata=wvc.query.MetadataQuery(distance=True),
-                    limit=6,
-                )
-                print(result)
-                if result['day'] == [0, 0] and result['month'] == [0, 0] and result['year'] == [2024, 2024]:
-                    self.sort_by = 'Date'
 
+            properties = self.projection.properties(collection)
+            # Fusion needs deep rankings; calibrated single-mode scores merge well from fewer results
+            limit = RESULT_LIMIT if llm_model == 'Hybrid' else RESULTS_PER_COLLECTION
 
-            elif llm_model == 'BM25':
-                response = collection_obj.query.bm25(
+            if mode == 'bm25':
+                response = self.meter.measure(
+                    f"{collection} (bm25)", collection_obj.query.bm25,
                     query=search_text,
-                    # return_properties=["filename"],                           # enable if required
-                    # return_metadata=wvc.query.MetadataQuery(distance=True),   # enable if required
-                    limit=6,
+                    filters=filters,
+                    return_properties=properties,
+                    return_metadata=wvc.query.MetadataQuery(score=True),
+                    limit=limit,
                 )
-            elif llm_model == 'Vanilla':
-                response = collection_obj.query.near_text(
-                    query=search_text,
-                    # return_properties=["filename"],                           # enable if required
-                    # return_metadata=wvc.query.MetadataQuery(distance=True),   # enable if required
-                    limit=6,
+            elif query_vectors:
+                response = self.meter.measure(
+                    f"{collection} (vector {i})" if len(query_vectors) > 1 else collection,
+                    collection_obj.query.near_vector,
+                    near_vector=query_vectors[i],
+                    distance=distance,
+                    filters=filters,
+                    return_properties=properties,
+                    return_metadata=wvc.query.MetadataQuery(distance=True),
+                    limit=limit,
                 )
-
-            # Extend the big response list with the response objects
-            self.big_response_list.extend(response.objects)
-
-
-    # Function to sort and filter the results
+            else:
+                response = self.meter.measure(
+                    collection, collection_obj.query.near_text,
+                    query=concepts,
+                    distance=distance,
+                    filters=filters,
+                    return_properties=properties,
+                    return_metadata=wvc.query.MetadataQuery(distance=True),
+                    limit=limit,
+                )
+            return response.objects
+
+        # Send the queries to all collections at once and keep whatever answers in time
+        # Each synonym is searched on its own, concurrently with the others
+        tasks = [(collection, mode, i) for collection in collections for mode in modes
+                 for i in range(len(query_vectors) if mode == 'vector' and query_vectors else 1)]
+        results, missing = fan_out(tasks, query_collection)
+        if missing:
+            names = sorted({collection for collection, _, _ in missing})
+            st.warning(f"No results from {', '.join(names)} (timed out or failed); showing partial results.")
+            self.cacheable = False
+
+        hit_lists = []
+        for collection in collections:
+            rankings = {}
+            for mode in modes:
+                found = [objects for (c, m, _), objects in results.items() if c == collection and m == mode]
+                if found:
+                    # Objects found by several synonyms are kept once, with their best score
+                    rankings[mode] = merge_expansions(found)
+            if llm_model == 'Hybrid':
+                hit_lists.append(rrf_fuse(rankings, collection, alpha=self.alpha))
+            else:
+                hit_lists.append(hits_from_objects(rankings.get(modes[0], []), collection))
+        if llm_model != 'Hybrid':
+            # Raw distances and BM25 scores are not comparable across collections; calibrate them first
+            hit_lists = calibrator.calibrate_lists(hit_lists)
+        # One hit per document, with its best passages as highlights
+        by_collection = dict(zip(collections, hit_lists))
+        if PASSAGE_COLLECTION in by_collection:
+            passages = aggregate_passages(by_collection.pop(PASSAGE_COLLECTION))
+            by_collection['pdf'] = merge_documents(by_collection.get('pdf', []), passages)
+        # One hit per video, at its best matching segment
+        if 'videos' in by_collection:
+            by_collection['videos'] = collapse_by_filename(by_collection['videos'])
+        hit_lists = list(by_collection.values())
+        # Fused scores are rank-based, calibrated scores are comparable: merge into one ranking
+        if llm_model == 'Hybrid':
+            self.big_response_list.extend(merge_hits(hit_lists, limit=RESULT_LIMIT))
+        else:
+            self.big_response_list.extend(top_k(hit_lists, RESULT_LIMIT))
+
+
+    # Function to sort the results
     def sort_and_filter_results(self, sort_by, filter_by_relevance, relevance_threshold, filter_by_date, date_before, date_after):
         """
-        Sort and filter the results. This function sorts the results by relevance or date, and filters the results by relevance or date.
+        Sort the results by relevance or date. Filtering by relevance and date is done by Weaviate
+        when querying (see `build_filters`), so only the merged results of all collections are sorted here.
         """
         default_date = datetime.min.replace(tzinfo=timezone.utc)
         # Sort the results by relevance or date
         if sort_by == 'Relevance':
-            try:
-                self.big_response_list.sort(key=lambda x: x.metadata.distance)
-            except:
-                pass
+            self.big_response_list.sort(key=lambda x: x.score, reverse=True)
         elif sort_by == 'Date':
             # Use a default date for items without a 'date_modified' property
-            default_date = datetime.min.replace(tzinfo=timezone.utc)
-            self.big_response_list.sort(key=lambda x: x.properties.get('date_modified', default_date))
-
-        # Filter the results by relevance or date
-        if filter_by_relevance:
-            self.big_response_list = [r for r in self.big_response_list if r.metadata.distance <= relevance_threshold]
-        if filter_by_date:
-            if date_before:
-                date_before = datetime.strptime(date_before, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-                self.big_response_list = [r for r in self.big_response_list if r.properties.get('date_modified', default_date) <= date_before]
-            if date_after:
-                date_after = datetime.strptime(date_after, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-                self.big_response_list = [r for r in self.big_response_list if r.properties.get('date_modified', default_date) >= date_after]
+            self.big_response_list.sort(key=lambda x: x.properties.get('date_modified') or default_date)
 
 
 
     # Function to display the results
     def display_results(self):
         """
-        Display the results. This function displays the properties and metadata of each result.
+        Display the results. This function displays the properties, a cached preview and the metadata of each result.
+        The full image, video or PDF is only loaded when the result is opened.
         """
-        st.subheader("Results found:")
-        for i, r in enumerate(self.big_response_list):
-            if i % 3 == 0:
+        st.subheader(f"Results found: {len(self.big_response_list)}")
+
+        # Page through the cached results with a cursor instead of re-querying
+        cursor = min(ss.get('cursor', 0), max(len(self.big_response_list) - 1, 0))
+        page = self.big_response_list[cursor:cursor + PAGE_SIZE]
+        nav_cols = st.columns([0.2, 0.6, 0.2])
+        nav_cols[0].button("Previous", disabled=cursor == 0,
+                           on_click=lambda: ss.update(cursor=max(cursor - PAGE_SIZE, 0)))
+        nav_cols[1].write(f"Showing {cursor + 1}-{cursor + len(page)}")
+        nav_cols[2].button("Next", disabled=cursor + PAGE_SIZE >= len(self.big_response_list),
+                           on_click=lambda: ss.update(cursor=cursor + PAGE_SIZE))
+
+        for i, r in enumerate(page, cursor):
+            if (i - cursor) % 3 == 0:
                 with st.container():
                     columns = st.columns(3)
                     st.divider()
@@ -224,38 +394,64 @@ class WeaviateApp:
                 except:
                     st.write(r.properties["title"])
 
-                try:
-                    imgpath = Path("data/images") / r.properties["filename"]
-                    img = imgpath.read_bytes()
-                    st.image(img)
+                path = self.resolve_media_path(r)
+                start_time = int(r.properties.get("start_time") or 0)
+                if path is not None:
+                    preview = preview_cache.get(path, at=start_time)
+                    if preview is not None:
+                        st.image(preview.read_bytes())
+                    if path.suffix == ".mp4":
+                        st.write(f"Match at {start_time // 60}:{start_time % 60:02d}")
+                    if st.toggle("Open", key=f"open-{i}-{r.uuid}"):
+                        self.display_full(path, start_time)
+
+                for passage in r.highlights:
+                    st.caption(f"p. {passage['page_start']}: …{passage['text']}…")
+
+                st.write(f"Score: {r.score:.3f}")
+                if r.metadata.distance is not None:
                     st.write(f"Relevance: {r.metadata.distance:.3f}")
-                except:
-                    try:
-                        vidpath = Path("data/videos") / r.properties["filename"]
-                        vid = vidpath.read_bytes()
-                        st.video(vid)
-                        st.write(f"Relevance: {r.metadata.distance:.3f}")
-                    except:
-                        pass
 
-                    try:
-                        binary_data = Path("data/pdf") / r.properties["filename"]
-                        binary_data = binary_data.read_bytes()
-                        # binary_data = ss.pdf_ref.getvalue()
-                        pdf_viewer(input=binary_data, width=250,height=250,pages_to_render=[1,2])
-
-                    except:
-                        pass
-
-                    if r.metadata.distance:
-                        st.write(f"Relevance: {r.metadata.distance:.3f}")
-                    pass
-                    
                 if debug==True:
                     st.write(f"date_created: {r.properties['date_modified']}")
                     st.write(f"date_modified: {r.properties['date_created']}")
                     # st.write(f"Metadata: {r.metadata}")
 
+    # Function to find the file of a result on disk
+    def resolve_media_path(self, r):
+        """
+        Find the file a result refers to: in the blob store for media stored by reference,
+        otherwise in the data folders.
+
+        Returns:
+            Path: The file, or None if the result has no file on disk.
+        """
+        filename = r.properties.get("filename")
+        if not filename:
+            return None
+        content_hash = r.properties.get("content_hash")
+        if content_hash:
+            path = blob_store.get(content_hash, Path(filename).suffix.lower())
+            if path is not None:
+                return path
+        for folder in ("data/images", "data/videos", "data/pdf"):
+            path = Path(folder) / filename
+            if path.exists():
+                return path
+        return None
+
+    # Function to display the full content of a result
+    def display_full(self, path, start_time=0):
+        """
+        Display the full image, video (from the matching segment) or PDF of a result.
+        """
+        if path.suffix == ".mp4":
+            st.video(path.read_bytes(), start_time=start_time)
+        elif path.suffix == ".pdf":
+            pdf_viewer(input=path.read_bytes(), width=250,height=250,pages_to_render=[1,2])
+        else:
+            st.image(path.read_bytes())
+
 
     # Function to display the data ingestion page
     def data_ingestion_page(self, state):
@@ -266,11 +462,28 @@ class WeaviateApp:
         self.display_title()
         st.title("Data Ingestion Page")
 
+        # Show the status of the continuous indexer (python -m scripts.watcher) if it is running
+        metrics_path = Path(".cache/watcher_metrics.json")
+        if metrics_path.exists():
+            metrics = json.loads(metrics_path.read_text())
+            if time.time() - metrics["updated"] < 30:
+                st.subheader("Continuous indexing")
+                metric_cols = st.columns(4)
+                metric_cols[0].metric("Queued files", metrics["queue_depth"] + metrics.get("in_progress", 0))
+                metric_cols[1].metric("Lag (s)", f"{metrics['lag_s']:.1f}")
+                metric_cols[2].metric("Ingested", metrics["ingested"])
+                metric_cols[3].metric("Failed", metrics["failed"])
+
         state.data_dir = st.text_input("Enter the directory of your data", state.data_dir if hasattr(state, 'data_dir') else './data')
         if st.button("Ingest & Process Data"):
             st.write("Ingesting and processing data...")
-            os.system(f"python add_data.py --data-dir {state.data_dir}")
-            st.write("Data ingestion completed!")
+            ingestion = subprocess.run([sys.executable, "-m", "scripts.add_data", "--incremental", "--data-dir", state.data_dir],
+                                       capture_output=True, text=True)
+            if ingestion.returncode == 0:
+                st.write("Data ingestion completed!")
+            else:
+                st.error("Data ingestion failed.")
+            st.code(ingestion.stdout[-4000:] + ingestion.stderr[-4000:])
 
     # Function to run the application
     def run(self):
@@ -282,6 +495,8 @@ class WeaviateApp:
 
         st.sidebar.title("Navigation")
         app_mode = st.sidebar.selectbox("Choose the page", ["Data Ingestion Page", "Search Page"])
+        if not QUERY_SERVER:
+            st.sidebar.caption(f"TinyLlama model: {llama.status}")
 
         if app_mode == "Data Ingestion Page":
             self.data_ingestion_page(state)
@@ -293,21 +508,56 @@ class WeaviateApp:
             self.sort_by, self.filter_by_relevance, self.relevance_threshold, self.filter_by_date, self.date_before, self.date_after = self.get_sort_filter_inputs()
 
             # Add a toggle for the LLM model
-            llm_model = st.selectbox('LLM Model', ['BM25', 'TinyLlamma','Vanilla'])
+            llm_model = st.selectbox('LLM Model', ['Hybrid', 'BM25', 'TinyLlamma','Vanilla'])
+            if llm_model == 'Hybrid':
+                self.alpha = st.slider('Hybrid weight (0 = keywords only, 1 = vectors only)', 0.0, 1.0, ALPHA)
 
             # Add a search button
-            if st.button('Search'):
+            searched = st.button('Search')
+            if searched:
                 if search_text != "" or img is not None:
                     if img is not None:
                         st.image(img, caption="Uploaded Image", use_column_width=True)
-                        self.search_by_image(img)
-                    else:
-                        self.search_by_text(search_text,llm_model)
-
-                    self.sort_and_filter_results(self.sort_by, self.filter_by_relevance, self.relevance_threshold, self.filter_by_date, self.date_before, self.date_after)
-                    
-                    self.display_results()
 
+                    # Identical searches since the last ingestion are answered from the cache
+                    filters = (self.sort_by, self.filter_by_relevance, self.relevance_threshold, self.filter_by_date, self.date_before, self.date_after, self.alpha)
+                    key = make_key(llm_model if img is None else 'image', search_text, img.getvalue() if img is not None else None, filters, read_generation())
+                    session_cache = ss.setdefault('result_cache', {})
+                    results = session_cache.get(key)
+                    if results is None:
+                        results = result_cache.get(key)
+                    if results is not None:
+                        self.big_response_list = list(results)
+                        session_cache[key] = self.big_response_list
+                    else:
+                        self.meter.reset()
+                        # Cleared by the search if it fell back to another mode or some collections did not answer
+                        self.cacheable = True
+                        if img is not None:
+                            self.search_by_image(img)
+                        else:
+                            self.search_by_text(search_text,llm_model)
+
+                        self.sort_and_filter_results(self.sort_by, self.filter_by_relevance, self.relevance_threshold, self.filter_by_date, self.date_before, self.date_after)
+                        if self.cacheable:
+                            result_cache.put(key, self.big_response_list)
+                            session_cache[key] = self.big_response_list
+                        if debug==True:
+                            sizes = self.meter.summary()
+                            total = sum(m["bytes"] for m in sizes.values())
+                            st.caption(f"Estimated response size: {total / 1024:.1f} KiB ("
+                                       + ", ".join(f"{c}: {m['bytes'] / 1024:.1f} KiB in {m['seconds'] * 1000:.0f} ms" for c, m in sizes.items()) + ")")
+
+                    # Keep the results so paging or opening one (which reruns the script) does not re-query
+                    ss['results'] = self.big_response_list
+                    ss['cursor'] = 0
+            elif 'results' in ss:
+                self.big_response_list = ss['results']
+
+            if self.big_response_list:
+                self.display_results()
+
+            if searched:
                 # Display the selected sort and filter options
                 st.subheader("Selected Options")
                 st.write(f"Sort by: {self.sort_by}")
@@ -319,6 +569,8 @@ class WeaviateApp:
                     st.write(f"Before Date: {self.date_before}")
                     st.write(f"After Date: {self.date_after}")
                 st.write(f"LLM Model: {llm_model}")
+                if llm_model == 'Hybrid':
+                    st.write(f"Hybrid weight: {self.alpha}")
                 self.sort_by = 'Relevance'
 
 # Run the application
@@ -7,6 +7,12 @@ from weaviate.collections.classes.batch import BatchObjectReturn
 import base64
 from pathlib import Path
 from scripts.get_metadata import createFileRecords 
+from scripts.batch_writer import batched, insert_batches, print_report, BATCH_SIZE, BATCH_BYTES
+from scripts.blob_store import blob_store, MEDIA_STORAGE
+from scripts.query_embedding import embed_media
+
+# Images per vectorization request when images are stored by reference
+EMBED_BATCH_SIZE = 16
 
 
 def define_collection_images(client: WeaviateClient, collection_name: str = 'images') -> bool:
@@ -37,6 +43,16 @@ def define_collection_images(client: WeaviateClient, collection_name: str = 'ima
                 data_type=wvc.config.DataType.TEXT,
                 skip_vectorization=True,  # Not vectorizing for demonstrative purposes
             ),
+            wvc.Property(
+                name="path",
+                data_type=wvc.config.DataType.TEXT,
+                skip_vectorization=True,
+            ),
+            wvc.Property(
+                name="content_hash",
+                data_type=wvc.config.DataType.TEXT,
+                skip_vectorization=True,
+            ),
             wvc.Property(
                 name="date_created",
                 data_type=wvc.config.DataType.DATE,
@@ -47,7 +63,7 @@ def define_collection_images(client: WeaviateClient, collection_name: str = 'ima
             ),
             wvc.Property(
                 name="file_size",
-                data_type=wvc.config.DataType.TEXT,
+                data_type=wvc.config.DataType.INT,
             ),
             wvc.Property(
                 name="author",
@@ -58,49 +74,98 @@ def define_collection_images(client: WeaviateClient, collection_name: str = 'ima
     return True
 
 
-def import_data_images(client: WeaviateClient, collection_name: str = 'images') -> BatchObjectReturn:
+def image_properties(f: Path) -> dict:
     """
-    Import image data into the specified collection in Weaviate.
+    Build the metadata properties of an image.
 
     Args:
-        client (WeaviateClient): The Weaviate client.
-        collection_name (str, optional): The name of the collection. Defaults to 'images'.
+        f (Path): Path to the image.
 
     Returns:
-        BatchObjectReturn: The response object containing information about the import process.
+        dict: The properties shared by both storage modes.
     """
-    mm_coll = client.collections.get(collection_name)
-    imgdir = Path("data/images")
-
-    data_objs = list()
+    meta_data = createFileRecords(f)
+    return {
+        "filename": f.name,
+        "path": str(f),
+        "date_created": meta_data['Creation Date'].isoformat(),
+        "date_modified": meta_data['Modified Date'].isoformat(),
+        "file_size": meta_data['Size (bytes)'],
+        "author": '0'
+    }
+
+
+def iter_image_objects(imgdir: Path = Path("data/images"), files: list = None, storage: str = MEDIA_STORAGE,
+                       failures: list = None):
+    """
+    Lazily build a data object per image, reading one file at a time.
+    With storage "reference", images are vectorized here in small batches and copied to the
+    blob store, and only their path and content hash are stored in Weaviate.
 
-    for f in imgdir.glob("*.jpg"):
-        b64img = base64.b64encode(f.read_bytes()).decode()
-        meta_data = createFileRecords(f)
+    Args:
+        imgdir (Path, optional): Directory holding the images. Defaults to 'data/images'.
+        files (list, optional): Only these image paths instead of the whole directory. Defaults to None.
+        storage (str, optional): "reference" or "blob". Defaults to MEDIA_STORAGE.
+        failures (list, optional): Receives the names of the images that could not be vectorized. Defaults to None.
 
-        data_props = {
-            "image": b64img,
-            "filename": f.name,
-            "date_created": meta_data['Creation Date'].isoformat(),
-            "date_modified": meta_data['Modified Date'].isoformat(),
-            "file_size": meta_data['Size (KB)'],
-            "author": '0'
-        }
+    Yields:
+        DataObject: The data object of one image.
+    """
+    paths = iter(files if files is not None else imgdir.glob("*.jpg"))
+    if storage != "reference":
+        for f in paths:
+            data_props = image_properties(f)
+            data_props["image"] = base64.b64encode(f.read_bytes()).decode()
+            yield wvc.data.DataObject(
+                properties=data_props, uuid=generate_uuid5(f.name)
+            )
+        return
+
+    while chunk := [f for _, f in zip(range(EMBED_BATCH_SIZE), paths)]:
+        try:
+            vectors, _ = embed_media(images=[base64.b64encode(f.read_bytes()).decode() for f in chunk])
+        except Exception as e:
+            print(f"Failed to vectorize {', '.join(f.name for f in chunk)}: {e}")
+            if failures is not None:
+                failures.extend(f.name for f in chunk)
+            continue
+        for f, vector in zip(chunk, vectors):
+            data_props = image_properties(f)
+            data_props["content_hash"] = blob_store.put(f)
+            yield wvc.data.DataObject(
+                properties=data_props, uuid=generate_uuid5(f.name), vector=vector
+            )
+
+
+def import_data_images(client: WeaviateClient, collection_name: str = 'images',
+                       batch_size: int = BATCH_SIZE, batch_bytes: int = BATCH_BYTES, files: list = None) -> dict:
+    """
+    Import image data into the specified collection in Weaviate.
+    Images are streamed in batches bounded by count and bytes, so memory use does not grow
+    with the size of the folder, and each batch is retried on its own. See `iter_image_objects`
+    for how images are stored.
 
-        data_obj = wvc.data.DataObject(
-            properties=data_props, uuid=generate_uuid5(f.name)
-        )
-        data_objs.append(data_obj)
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str, optional): The name of the collection. Defaults to 'images'.
+        batch_size (int, optional): Maximum number of images per batch. Defaults to BATCH_SIZE.
+        batch_bytes (int, optional): Maximum encoded bytes per batch. Defaults to BATCH_BYTES.
+        files (list, optional): Only import these image paths. Defaults to every image in 'data/images'.
 
-    insert_response = mm_coll.data.insert_many(data_objs)
+    Returns:
+        dict: Counts of batches, inserted and failed images, and the error messages.
+    """
+    mm_coll = client.collections.get(collection_name)
 
-    print(f"{len(insert_response.all_responses)} insertions complete.")
-    print(f"{len(insert_response.errors)} errors within.")
-    if insert_response.has_errors:
-        for e in insert_response.errors:
-            print(e)
+    failures = []
+    batches = batched(iter_image_objects(files=files, failures=failures), batch_size, batch_bytes)
+    report = insert_batches(mm_coll, batches, label=lambda data_obj: data_obj.properties["filename"])
+    report["failed"] += len(failures)
+    report["failed_objects"].extend(failures)
+    report["errors"].extend(f"{name}: could not be vectorized" for name in failures)
+    print_report(report)
 
-    return insert_response
+    return report
 
 
 # def define_collection_images(client: WeaviateClient, collection_name: str = 'images') -> bool:
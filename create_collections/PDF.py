@@ -5,9 +5,25 @@ from weaviate.util import generate_uuid5
 from weaviate import WeaviateClient
 from weaviate.collections.classes.batch import BatchObjectReturn
 from pathlib import Path
-from unstructured.partition.pdf import partition_pdf
-from scripts.AbstractExtractor import AbstractExtractor
+from scripts.AbstractExtractor import extract_abstract
 from scripts.get_metadata import createFileRecords 
+from scripts.batch_writer import batched, insert_batches, print_report
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pypdf import PdfReader
+import os
+
+# Number of processes parsing PDFs in parallel
+PDF_WORKERS = os.cpu_count()
+
+# Pages read for the abstract on the fast path
+FAST_PAGES = 2
+
+# Read abstracts from the text layer; False partitions the layout of the first pages to find the
+# abstract section (slower, needs unstructured). Overridden by --layout in add_data and the watcher
+PDF_FAST = True
+
+# Also index every document as overlapping passages in the 'pdf_passages' child collection
+PDF_PASSAGES = True
 
 
 def define_collection_pdfs(client: WeaviateClient, collection_name: str = 'pdfs') -> bool:
@@ -51,7 +67,7 @@ def define_collection_pdfs(client: WeaviateClient, collection_name: str = 'pdfs'
             ),
             wvc.Property(
                 name="file_size",
-                data_type=wvc.DataType.TEXT,
+                data_type=wvc.DataType.INT,
             ),
             wvc.Property(
                 name="author",
@@ -66,48 +82,122 @@ def define_collection_pdfs(client: WeaviateClient, collection_name: str = 'pdfs'
     return True
 
 
-def import_data_pdf(client: WeaviateClient, collection_name: str = 'pdf') -> BatchObjectReturn:
+def extract_pdf_record(path: Path, fast: bool = PDF_FAST) -> dict:
     """
-    Import PDF data into the specified collection in Weaviate.
+    Extract the properties of one PDF. Runs inside a worker process.
 
     Args:
-        client (WeaviateClient): The Weaviate client.
-        collection_name (str, optional): The name of the collection. Defaults to 'pdf'.
+        path (Path): Path to the PDF file.
+        fast (bool, optional): Read the abstract from the text layer of the first FAST_PAGES pages. Otherwise
+            the first pages are partitioned one at a time until the abstract section has been read,
+            see `extract_abstract`. Defaults to PDF_FAST.
 
     Returns:
-        BatchObjectReturn: The response object containing information about the import process.
+        dict: The properties of the PDF object.
     """
-    data_folder = "data/pdf/"
+    meta_data = createFileRecords(path)
+
+    reader = PdfReader(path)
+    num_pages = len(reader.pages)
+    if fast:
+        abstract = ' '.join(page.extract_text() for page in reader.pages[:FAST_PAGES])
+    else:
+        abstract = extract_abstract(path)
+
+    return {"filename": path.name,
+            "abstract": abstract,
+            "num_pages": num_pages,
+            "date_created": meta_data['Creation Date'].isoformat(),
+            "date_modified": meta_data['Modified Date'].isoformat(),
+            "file_size": meta_data['Size (bytes)'],
+            "author": '0'
+            }
+
+
+def iter_pdf_records(paths, workers: int = PDF_WORKERS, fast: bool = PDF_FAST, failures: list = None):
+    """
+    Parse PDFs in a process pool and yield their records as soon as each one is ready.
 
-    data_objects = []
+    Args:
+        paths (list): Paths of the PDF files.
+        workers (int, optional): Number of worker processes. Defaults to PDF_WORKERS.
+        fast (bool, optional): Use the fast extraction path, see `extract_pdf_record`. Defaults to PDF_FAST.
+        failures (list, optional): Receives the names of the files that could not be parsed. Defaults to None.
 
-    for path in Path(data_folder).iterdir():
-        if path.suffix != ".pdf":
-            continue
-            
-        print(f"Processing {path.name}...")
+    Yields:
+        dict: The properties of one PDF.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_pdf_record, path, fast): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                print(f"Failed to parse {path.name}: {e}")
+                if failures is not None:
+                    failures.append(path.name)
+                continue
+            print(f"Processed {path.name}")
+            yield record
+
+
+def iter_pdf_objects(paths, workers: int = PDF_WORKERS, fast: bool = PDF_FAST, failures: list = None):
+    """
+    Parse PDFs in a process pool and yield their data objects as soon as each one is ready.
 
-        elements = partition_pdf(filename=path)
-        meta_data = createFileRecords(path)
+    Args:
+        paths (list): Paths of the PDF files.
+        workers (int, optional): Number of worker processes. Defaults to PDF_WORKERS.
+        fast (bool, optional): Use the fast extraction path, see `extract_pdf_record`. Defaults to PDF_FAST.
+        failures (list, optional): Receives the names of the files that could not be parsed. Defaults to None.
 
-        data_object = {"filename": path.name, 
-                       "abstract": ' '.join([data.text for data in elements][:20]), 
-                       "num_pages": len(elements),
-                       "date_created": meta_data['Creation Date'].isoformat(),
-                       "date_modified": meta_data['Modified Date'].isoformat(),
-                       "file_size": meta_data['Size (KB)'],
-                       "author": '0'
-                       }
+    Yields:
+        DataObject: The data object of one PDF.
+    """
+    for record in iter_pdf_records(paths, workers, fast, failures):
+        yield wvc.data.DataObject(properties=record, uuid=generate_uuid5(record["filename"]))
 
-        data_objects.append(data_object)
 
-    pdf_collection = client.collections.get(collection_name)
-    insert_response = pdf_collection.data.insert_many(data_objects)
+def import_data_pdf(client: WeaviateClient, collection_name: str = 'pdf',
+                    workers: int = PDF_WORKERS, fast: bool = PDF_FAST, files: list = None,
+                    passages: bool = PDF_PASSAGES) -> dict:
+    """
+    Import PDF data into the specified collection in Weaviate.
+    PDFs are parsed in parallel and written in batches as they come back from the workers.
+    With `passages`, the full text of each PDF is then indexed in the passage collection.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str, optional): The name of the collection. Defaults to 'pdf'.
+        workers (int, optional): Number of parsing processes. Defaults to PDF_WORKERS.
+        fast (bool, optional): Use the fast extraction path, see `extract_pdf_record`. Defaults to PDF_FAST.
+        files (list, optional): Only import these PDF paths. Defaults to every PDF in 'data/pdf'.
+        passages (bool, optional): Also index the passages of the PDFs. Defaults to PDF_PASSAGES.
 
-    print(f"{len(insert_response.all_responses)} insertions complete.")
-    print(f"{len(insert_response.errors)} errors within.")
-    if insert_response.has_errors:
-        for e in insert_response.errors:
-            print(e)
+    Returns:
+        dict: Counts of batches, inserted and failed PDFs, and the error messages. Files whose passages
+            could not be indexed are listed in 'failed_objects' too, so they are retried.
+    """
+    data_folder = "data/pdf/"
 
-    return insert_response
+    paths = files if files is not None else [path for path in Path(data_folder).iterdir() if path.suffix == ".pdf"]
+
+    parse_failures = []
+    data_objects = iter_pdf_objects(paths, workers, fast, parse_failures)
+
+    pdf_collection = client.collections.get(collection_name)
+    report = insert_batches(pdf_collection, batched(data_objects),
+                            label=lambda data_obj: data_obj.properties["filename"])
+    report["failed"] += len(parse_failures)
+    report["failed_objects"].extend(parse_failures)
+    report["errors"].extend(f"{name}: could not be parsed" for name in parse_failures)
+    print_report(report)
+
+    if passages:
+        from create_collections.PDFPassages import import_data_pdf_passages
+        passage_report = import_data_pdf_passages(client, parent=collection_name, workers=workers, files=paths)
+        report["failed_objects"].extend(sorted(set(passage_report["failed_objects"])))
+        report["errors"].extend(passage_report["errors"])
+
+    return report
@@ -0,0 +1,145 @@
+# Import necessary libraries
+import weaviate.classes as wvc
+from weaviate.util import generate_uuid5
+from weaviate import WeaviateClient
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pypdf import PdfReader
+from scripts.get_metadata import createFileRecords
+from scripts.batch_writer import batched, insert_batches, print_report
+from scripts.passages import PASSAGE_COLLECTION, split_passages
+from scripts.query_embedding import vectorize
+import os
+
+# Number of processes extracting text in parallel
+PASSAGE_WORKERS = os.cpu_count()
+
+# Passages per vectorization request
+EMBED_BATCH_SIZE = 64
+
+
+def define_collection_pdf_passages(client: WeaviateClient, collection_name: str = PASSAGE_COLLECTION,
+                                   parent: str = 'pdf') -> bool:
+    """
+    Define a collection for the passages of PDFs in Weaviate, referencing the parent document.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str, optional): The name of the collection. Defaults to PASSAGE_COLLECTION.
+        parent (str, optional): The collection of the documents. Defaults to 'pdf'.
+
+    Returns:
+        bool: True if collection creation is successful, otherwise False.
+    """
+    client.collections.create(
+        name=collection_name,
+        description="Passages of the PDF collection",
+        properties=[
+            wvc.Property(name="text", data_type=wvc.DataType.TEXT),
+            wvc.Property(name="filename", data_type=wvc.DataType.TEXT, skip_vectorization=True),
+            wvc.Property(name="passage_index", data_type=wvc.DataType.INT),
+            wvc.Property(name="page_start", data_type=wvc.DataType.INT),
+            wvc.Property(name="page_end", data_type=wvc.DataType.INT),
+            # Copied from the document so that date filters apply to passage searches
+            wvc.Property(name="date_created", data_type=wvc.DataType.DATE),
+            wvc.Property(name="date_modified", data_type=wvc.DataType.DATE),
+            wvc.Property(name="file_size", data_type=wvc.DataType.INT),
+            wvc.Property(name="author", data_type=wvc.DataType.TEXT),
+        ],
+        references=[wvc.config.ReferenceProperty(name="document", target_collection=parent)],
+        vectorizer_config=wvc.config.Configure.Vectorizer.multi2vec_bind(
+            text_fields=[wvc.config.Multi2VecField(name='text', weight=1.0)],
+            vectorize_collection_name=False)
+    )
+    return True
+
+
+def extract_pdf_passages(path: Path) -> list:
+    """
+    Split the text layer of one PDF into passages. Runs inside a worker process.
+
+    Args:
+        path (Path): Path to the PDF file.
+
+    Returns:
+        list: The properties of each passage.
+    """
+    meta_data = createFileRecords(path)
+    pages = [page.extract_text() for page in PdfReader(path).pages]
+    document = {"filename": path.name,
+                "date_created": meta_data['Creation Date'].isoformat(),
+                "date_modified": meta_data['Modified Date'].isoformat(),
+                "file_size": meta_data['Size (bytes)'],
+                "author": '0'
+                }
+    return [{**passage, **document} for passage in split_passages(pages)]
+
+
+def iter_passage_objects(paths, workers: int = PASSAGE_WORKERS, failures: list = None):
+    """
+    Extract passages in a process pool and yield them as data objects, vectorized in batches.
+
+    Args:
+        paths (list): Paths of the PDF files.
+        workers (int, optional): Number of worker processes. Defaults to PASSAGE_WORKERS.
+        failures (list, optional): Receives the names of the files that could not be processed. Defaults to None.
+
+    Yields:
+        DataObject: The data object of one passage, referencing its document.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_pdf_passages, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                passages = future.result()
+                for start in range(0, len(passages), EMBED_BATCH_SIZE):
+                    chunk = passages[start:start + EMBED_BATCH_SIZE]
+                    vectors = vectorize({"texts": [p["text"] for p in chunk]}, timeout=120)["textVectors"]
+                    for passage, vector in zip(chunk, vectors):
+                        yield wvc.data.DataObject(
+                            properties=passage,
+                            uuid=generate_uuid5(f"{passage['filename']}#{passage['passage_index']}"),
+                            references={"document": wvc.data.Reference.to(uuids=generate_uuid5(passage["filename"]))},
+                            vector=vector,
+                        )
+            except Exception as e:
+                print(f"Failed to index the passages of {path.name}: {e}")
+                if failures is not None:
+                    failures.append(path.name)
+                continue
+            print(f"Indexed {len(passages)} passages of {path.name}")
+
+
+def import_data_pdf_passages(client: WeaviateClient, collection_name: str = PASSAGE_COLLECTION,
+                             parent: str = 'pdf', workers: int = PASSAGE_WORKERS, files: list = None) -> dict:
+    """
+    Import the passages of PDFs into the passage collection, creating it if needed.
+    Existing passages of the given files are replaced.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str, optional): The name of the collection. Defaults to PASSAGE_COLLECTION.
+        parent (str, optional): The collection of the documents. Defaults to 'pdf'.
+        workers (int, optional): Number of extraction processes. Defaults to PASSAGE_WORKERS.
+        files (list, optional): Only import these PDF paths. Defaults to every PDF in 'data/pdf'.
+
+    Returns:
+        dict: Counts of batches, inserted and failed passages, and the error messages.
+    """
+    paths = files if files is not None else sorted(Path("data/pdf").glob("*.pdf"))
+
+    if not client.collections.exists(collection_name):
+        define_collection_pdf_passages(client, collection_name, parent)
+    passage_collection = client.collections.get(collection_name)
+    for path in paths:
+        passage_collection.data.delete_many(where=wvc.query.Filter("filename").equal(path.name))
+
+    failures = []
+    report = insert_batches(passage_collection, batched(iter_passage_objects(paths, workers, failures)),
+                            label=lambda data_obj: data_obj.properties["filename"])
+    report["failed_objects"].extend(failures)
+    report["errors"].extend(f"{name}: passages could not be indexed" for name in failures)
+    print_report(report)
+
+    return report
@@ -7,6 +7,27 @@ from weaviate.util import generate_uuid5
 import weaviate.classes as wvc
 from weaviate.collections.classes.batch import BatchObjectReturn
 from scripts.get_metadata import createFileRecords
+from scripts.batch_writer import batched, insert_batches, print_report
+from scripts.blob_store import blob_store, MEDIA_STORAGE
+from scripts.query_embedding import embed_media, embed_texts
+import csv
+import shutil
+import subprocess
+import tempfile
+
+# Length of the clips each video is split into; every clip gets its own vector
+SEGMENT_SECONDS = 10
+
+# Clips per insert request; a clip is a few MB of base64
+VIDEO_BATCH_SIZE = 8
+VIDEO_BATCH_BYTES = 64 * 1024 * 1024
+
+# Clips per vectorization request when videos are stored by reference
+EMBED_BATCH_SIZE = 4
+
+# Weights of the clip and of the filename in the vector, as in the collection's vectorizer config
+VIDEO_WEIGHT = 0.95
+FILENAME_WEIGHT = 0.05
 
 def define_collection_videos(client: WeaviateClient, collection_name: str = 'videos') -> bool:
     """
@@ -24,8 +45,8 @@ def define_collection_videos(client: WeaviateClient, collection_name: str = 'vid
         name=collection_name,
         description="Video collection",
         vectorizer_config=wvc.config.Configure.Vectorizer.multi2vec_bind(
-            video_fields=[wvc.config.Multi2VecField(name='video', weight=0.95)],
-            text_fields=[wvc.config.Multi2VecField(name='filename', weight=0.05)],
+            video_fields=[wvc.config.Multi2VecField(name='video', weight=VIDEO_WEIGHT)],
+            text_fields=[wvc.config.Multi2VecField(name='filename', weight=FILENAME_WEIGHT)],
             vectorize_collection_name=False
         ),
         generative_config=wvc.config.Configure.Generative.openai(),
@@ -39,6 +60,28 @@ def define_collection_videos(client: WeaviateClient, collection_name: str = 'vid
                 data_type=wvc.config.DataType.TEXT,
                 skip_vectorization=True,  # Not vectorizing for demonstrative purposes
             ),
+            wvc.Property(
+                name="path",
+                data_type=wvc.config.DataType.TEXT,
+                skip_vectorization=True,
+            ),
+            wvc.Property(
+                name="content_hash",
+                data_type=wvc.config.DataType.TEXT,
+                skip_vectorization=True,
+            ),
+            wvc.Property(
+                name="segment_index",
+                data_type=wvc.config.DataType.INT,
+            ),
+            wvc.Property(
+                name="start_time",
+                data_type=wvc.config.DataType.NUMBER,
+            ),
+            wvc.Property(
+                name="end_time",
+                data_type=wvc.config.DataType.NUMBER,
+            ),
             wvc.Property(
                 name="date_created",
                 data_type=wvc.config.DataType.DATE,
@@ -49,7 +92,7 @@ def define_collection_videos(client: WeaviateClient, collection_name: str = 'vid
             ),
             wvc.Property(
                 name="file_size",
-                data_type=wvc.config.DataType.TEXT,
+                data_type=wvc.config.DataType.INT,
             ),
             wvc.Property(
                 name="author",
@@ -59,51 +102,152 @@ def define_collection_videos(client: WeaviateClient, collection_name: str = 'vid
     )
     return True
 
-def import_data_videos(client: WeaviateClient, collection_name: str = 'videos') -> BatchObjectReturn:
+def iter_video_segments(video_file: Path, segment_seconds: int = SEGMENT_SECONDS):
     """
-    Import video data into the specified collection in Weaviate.
+    Split a video into clips of about `segment_seconds` with ffmpeg (stream copy, no re-encoding)
+    and yield them one at a time. Clips are cut at keyframes, so their real boundaries are read
+    from ffmpeg's segment list. Only one clip is held in memory at a time.
 
     Args:
-        client (WeaviateClient): The Weaviate client.
-        collection_name (str, optional): The name of the collection. Defaults to 'videos'.
+        video_file (Path): Path to the video.
+        segment_seconds (int, optional): Target clip length in seconds. Defaults to SEGMENT_SECONDS.
+
+    Yields:
+        tuple: (segment index, start time in seconds, end time in seconds, clip bytes).
+    """
+    if shutil.which("ffmpeg") is None:
+        print(f"ffmpeg not found, indexing {video_file.name} as a single segment")
+        yield 0, 0.0, None, video_file.read_bytes()
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        segment_list = tmpdir / "segments.csv"
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-i", str(video_file), "-map", "0", "-c", "copy",
+             "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+             "-segment_list", str(segment_list), "-segment_list_type", "csv",
+             str(tmpdir / "segment%05d.mp4")],
+            check=True,
+        )
+        with open(segment_list, newline="") as f:
+            for index, (name, start, end) in enumerate(csv.reader(f)):
+                segment = tmpdir / name
+                yield index, float(start), float(end), segment.read_bytes()
+                segment.unlink()
+
+
+def embed_segments(segments, filename_vector):
+    """
+    Vectorize clips in one request and combine each clip vector with the filename vector,
+    weighted like the collection's multi2vec-bind vectorizer.
+
+    Args:
+        segments (list): (segment index, start, end, clip bytes) tuples.
+        filename_vector (list): The text vector of the filename.
 
     Returns:
-        BatchObjectReturn: The response object containing information about the import process.
+        list: One vector per clip.
     """
-    # Get collection
-    videos_coll = client.collections.get(collection_name)
+    _, clip_vectors = embed_media(videos=[base64.b64encode(clip).decode() for *_, clip in segments])
+    return [[VIDEO_WEIGHT * v + FILENAME_WEIGHT * t for v, t in zip(vector, filename_vector)]
+            for vector in clip_vectors]
 
-    # Path to videos directory
-    videos_dir = Path("data/videos")
-    
-    data_objs = []
 
-    client.batch.configure(batch_size=1)  # Configure batch
-    with client.batch as batch:
-        # Iterate over video files
-        for video_file in videos_dir.glob("*.mp4"):
-            # Read video file as bytes and encode it in base64
-            b64video = base64.b64encode(video_file.read_bytes()).decode()
+def iter_video_objects(videos_dir: Path = Path("data/videos"), files: list = None,
+                       segment_seconds: int = SEGMENT_SECONDS, storage: str = MEDIA_STORAGE,
+                       failures: list = None):
+    """
+    Lazily build one data object per video segment.
+    With storage "reference", clips are vectorized here and the video is copied to the blob store;
+    Weaviate only stores its path and content hash with the vector of each segment.
+
+    Args:
+        videos_dir (Path, optional): Directory holding the videos. Defaults to 'data/videos'.
+        files (list, optional): Only these video paths instead of the whole directory. Defaults to None.
+        segment_seconds (int, optional): Target clip length in seconds. Defaults to SEGMENT_SECONDS.
+        storage (str, optional): "reference" or "blob". Defaults to MEDIA_STORAGE.
+        failures (list, optional): Receives the names of the videos that could not be indexed. Defaults to None.
 
-            # Get metadata for the video file
-            meta_data = createFileRecords(video_file)
+    Yields:
+        DataObject: The data object of one segment.
+    """
+    for video_file in (files if files is not None else videos_dir.glob("*.mp4")):
+        # Get metadata for the video file
+        meta_data = createFileRecords(video_file)
 
-            # Convert Creation Date and Modified Date to RFC 3339 format
-            creation_date_rfc3339 = meta_data['Creation Date'].astimezone(timezone.utc).isoformat()
-            modified_date_rfc3339 = meta_data['Modified Date'].astimezone(timezone.utc).isoformat()
+        # Convert Creation Date and Modified Date to RFC 3339 format
+        creation_date_rfc3339 = meta_data['Creation Date'].astimezone(timezone.utc).isoformat()
+        modified_date_rfc3339 = meta_data['Modified Date'].astimezone(timezone.utc).isoformat()
 
+        def make_object(index, start, end, clip=None, content_hash=None, vector=None):
             # Define data properties
             data_props = {
-                "video": b64video, 
                 "filename": video_file.name,
+                "path": str(video_file),
+                "segment_index": index,
+                "start_time": start,
+                "end_time": end,
                 "date_created": creation_date_rfc3339,
                 "date_modified": modified_date_rfc3339,
-                "file_size": meta_data['Size (KB)'],
+                "file_size": meta_data['Size (bytes)'],
                 "author": '0'  # Set author as placeholder value
             }
+            if clip is not None:
+                data_props["video"] = base64.b64encode(clip).decode()
+            if content_hash is not None:
+                data_props["content_hash"] = content_hash
+            return wvc.data.DataObject(
+                properties=data_props, uuid=generate_uuid5(f"{video_file.name}#{index}"), vector=vector
+            )
+
+        try:
+            if storage != "reference":
+                for index, start, end, clip in iter_video_segments(video_file, segment_seconds):
+                    yield make_object(index, start, end, clip=clip)
+                continue
+
+            content_hash = blob_store.put(video_file)
+            filename_vector = embed_texts([video_file.name])[0]
+            segments = iter_video_segments(video_file, segment_seconds)
+            while chunk := [segment for _, segment in zip(range(EMBED_BATCH_SIZE), segments)]:
+                for (index, start, end, _), vector in zip(chunk, embed_segments(chunk, filename_vector)):
+                    yield make_object(index, start, end, content_hash=content_hash, vector=vector)
+        except subprocess.CalledProcessError as e:
+            print(f"Failed to split {video_file.name}: {e}")
+            if failures is not None:
+                failures.append(video_file.name)
+        except OSError as e:
+            print(f"Failed to vectorize {video_file.name}: {e}")
+            if failures is not None:
+                failures.append(video_file.name)
 
-            # Create data object
-            a = batch.add_object(collection='videos',properties=data_props, uuid=generate_uuid5(video_file.name))
 
-    return batch.execute()
+def import_data_videos(client: WeaviateClient, collection_name: str = 'videos', files: list = None,
+                       segment_seconds: int = SEGMENT_SECONDS) -> dict:
+    """
+    Import video data into the specified collection in Weaviate.
+    Each video is split into short clips that are vectorized separately, so search hits resolve
+    to a timestamp and memory use is bounded by a batch of clips rather than whole files.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str, optional): The name of the collection. Defaults to 'videos'.
+        files (list, optional): Only import these video paths. Defaults to every video in 'data/videos'.
+        segment_seconds (int, optional): Target clip length in seconds. Defaults to SEGMENT_SECONDS.
+
+    Returns:
+        dict: Counts of batches, inserted and failed segments, and the error messages.
+    """
+    # Get collection
+    videos_coll = client.collections.get(collection_name)
+
+    failures = []
+    data_objs = iter_video_objects(files=files, segment_seconds=segment_seconds, failures=failures)
+    report = insert_batches(videos_coll, batched(data_objs, VIDEO_BATCH_SIZE, VIDEO_BATCH_BYTES),
+                            label=lambda data_obj: data_obj.properties["filename"])
+    report["failed_objects"].extend(failures)
+    report["errors"].extend(f"{name}: could not be indexed" for name in failures)
+    print_report(report)
 
+    return report
@@ -10,6 +10,9 @@ import json
 
 DATA_LIMITER = 5
 
+# Default location of the reviews
+WINE_REVIEWS_PATH = Path('./data/wine_reviews.csv')
+
 # Wines_test
 def define_collection_wine_reviews(client: WeaviateClient, collection_name: str = 'WineReviews') -> bool:
 
@@ -31,10 +34,11 @@ def define_collection_wine_reviews(client: WeaviateClient, collection_name: str
             vectorize_collection_name=False )
     )
 
-def import_data_wine_reviews(client: WeaviateClient,  collection_name: str = 'WineReviews') -> BatchObjectReturn:
+def import_data_wine_reviews(client: WeaviateClient,  collection_name: str = 'WineReviews',
+                             path: Path = WINE_REVIEWS_PATH) -> BatchObjectReturn:
 
-    data = pd.read_csv('./data/wine_reviews.csv', index_col=0)[:DATA_LIMITER]
-    wine_collection = client.collections.get("WineReviews")
+    data = pd.read_csv(path, index_col=0)[:DATA_LIMITER]
+    wine_collection = client.collections.get(collection_name)
 
     wines_to_add = [
     wvc.DataObject(
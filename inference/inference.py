@@ -1,60 +1,166 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, StoppingCriteria, StoppingCriteriaList
 from peft import PeftModel
 
-from inference.postprocess import extract_answer
+from inference.postprocess import extract_answer, InformationParser
 import json
+import copy
 
 # Check if GPU is available and choose the device accordingly
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def inference(ft_model, eval_tokenizer, query):
-    """
-    Perform inference to extract meta information from the user's query.
-
-    Args:
-        ft_model (PeftModel): Fine-tuned model for extracting meta information.
-        eval_tokenizer (AutoTokenizer): Tokenizer for the evaluation model.
-        query (str): User's query.
-
-    Returns:
-        str: Extracted meta information from the query.
-    """
-    
-
-    infer_prompt = f"""You are an expert at extracting useful information from user queries. I need you to extract meta information from the user's query.  The extraction reults contain 'year', 'month', 'day', 'file content', 'file type' information for file retriever to locate the file. The extracted information should exclusively contain key-value pairs. Additionally, please generate 5 synonyms for the extracted 'file content'. Below are 5 examples that meet these requirements:
+# Constant few-shot preamble shared by every query
+PROMPT_PREFIX = """You are an expert at extracting useful information from user queries. I need you to extract meta information from the user's query.  The extraction reults contain 'year', 'month', 'day', 'file content', 'file type' information for file retriever to locate the file. The extracted information should exclusively contain key-value pairs. Additionally, please generate 5 synonyms for the extracted 'file content'. Below are 5 examples that meet these requirements:
 Example1
 ### query: Project documentation from January 15, 2024, to February 20, 2024
-### information: {{'year': [2024, 2024], 'month': [1, 2], 'day': [15, 20], 'file content': ['Project Documentation', 'Project Files', 'Project Overview', 'Project Details', 'Project Progress Documentation'], 'file type': ['pdf', 'doc', 'docx']}}
+### information: {'year': [2024, 2024], 'month': [1, 2], 'day': [15, 20], 'file content': ['Project Documentation', 'Project Files', 'Project Overview', 'Project Details', 'Project Progress Documentation'], 'file type': ['pdf', 'doc', 'docx']}
 
 Example2
 ### query: Find my photos from New York last summer
-### information: {{'year': [-1, -1], 'month': [6, 8], 'day': [0, 0], 'file content': ['Photo taken in New York', 'New York Image', 'New York Snapshot', 'New York Picture', 'New York Photograph'], 'file type': ['jpg', 'jpeg', 'png', 'heif', 'tiff']}}
+### information: {'year': [-1, -1], 'month': [6, 8], 'day': [0, 0], 'file content': ['Photo taken in New York', 'New York Image', 'New York Snapshot', 'New York Picture', 'New York Photograph'], 'file type': ['jpg', 'jpeg', 'png', 'heif', 'tiff']}
 
 Example3
 ### query: How is AI transforming healthcare diagnostics?
-### information: {{'year': [], 'month': [], 'day': [], 'file content': ['AI in Healthcare Diagnostics', 'Artificial Intelligence and Medical Imaging', 'Machine Learning for Early Detection', 'AI Applications in Healthcare', 'Innovations in AI-based Diagnostics'], 'file type': ['pdf', 'docx', 'pptx', 'mp4', 'mp3']}}
+### information: {'year': [], 'month': [], 'day': [], 'file content': ['AI in Healthcare Diagnostics', 'Artificial Intelligence and Medical Imaging', 'Machine Learning for Early Detection', 'AI Applications in Healthcare', 'Innovations in AI-based Diagnostics'], 'file type': ['pdf', 'docx', 'pptx', 'mp4', 'mp3']}
 
 Example4
 ### query: Conference materials from the Global Tech Summit held from 2023/10/10 to 2023/10/12
-### information: {{'year': [2023, 2023], 'month': [10, 10], 'day': [10, 12], 'file content' : ['Global Tech Summit Materials', 'Tech Summit Presentations', 'Tech Conference Docs', 'Tech Summit Slides', 'Tech Summit Proceedings'], 'file type': ['pdf', 'pptx', 'doc', 'docx']}}
+### information: {'year': [2023, 2023], 'month': [10, 10], 'day': [10, 12], 'file content' : ['Global Tech Summit Materials', 'Tech Summit Presentations', 'Tech Conference Docs', 'Tech Summit Slides', 'Tech Summit Proceedings'], 'file type': ['pdf', 'pptx', 'doc', 'docx']}
 
 Example5
 ### query: The best ways to introduce coding to children
-### information: {{'year': [], 'month': [], 'day': [], 'file content': ['Coding for Kids', 'Children\'s Programming Basics', 'Fun Coding Projects for Kids', 'Learning to Code Through Games', 'Introduction to Programming for Young Learners'], 'file type': ['pdf', 'docx', 'pptx', 'mp4']}}
+### information: {'year': [], 'month': [], 'day': [], 'file content': ['Coding for Kids', 'Children\'s Programming Basics', 'Fun Coding Projects for Kids', 'Learning to Code Through Games', 'Introduction to Programming for Young Learners'], 'file type': ['pdf', 'docx', 'pptx', 'mp4']}
 
 Example6
 ### query: The latest annual reports of ABC Ltd
-### information: {{'year': [0, 0], 'month': [0, 0], 'day': [0, 0], 'file content': ['ABC Ltd. Annual Report', 'Yearly Financial Statement of ABC Ltd.', 'Annual Summary of ABC Ltd.', 'ABC Ltd. Year-End Report', 'ABC Ltd. Fiscal Year Report'], 'file type': ['pdf', 'xlsx', 'xls', 'docx', 'doc']}}
+### information: {'year': [0, 0], 'month': [0, 0], 'day': [0, 0], 'file content': ['ABC Ltd. Annual Report', 'Yearly Financial Statement of ABC Ltd.', 'Annual Summary of ABC Ltd.', 'ABC Ltd. Year-End Report', 'ABC Ltd. Fiscal Year Report'], 'file type': ['pdf', 'xlsx', 'xls', 'docx', 'doc']}
 
 Now, please extract meta information from this user query:
-### query: {query}
+### query:"""
+
+# Query-dependent suffix. It starts right after "### query:" so that tokenizing it on its own
+# (with the tokenizer's leading-space marker) yields the same tokens as the full prompt.
+QUERY_TEMPLATE = """{query}
 ### information: """
 
+def build_prompt(query):
+    """
+    Build the full few-shot prompt for a query.
+
+    Args:
+        query (str): User's query.
+
+    Returns:
+        str: The prompt fed to the model.
+    """
+    return PROMPT_PREFIX + " " + QUERY_TEMPLATE.format(query=query)
+
+def build_prefix_cache(ft_model, eval_tokenizer):
+    """
+    Encode the constant few-shot preamble once and keep its past_key_values,
+    so that each request only needs to prefill the query suffix.
+
+    Args:
+        ft_model (PeftModel): Fine-tuned model for extracting meta information.
+        eval_tokenizer (AutoTokenizer): Tokenizer for the evaluation model.
+
+    Returns:
+        dict: The preamble token ids and their past_key_values.
+    """
+    prefix_ids = eval_tokenizer(PROMPT_PREFIX, return_tensors="pt").input_ids.to(ft_model.device)
+    with torch.no_grad():
+        output = ft_model(input_ids=prefix_ids, use_cache=True)
+    return {"input_ids": prefix_ids, "past_key_values": output.past_key_values}
+
+def _fresh_past(past_key_values):
+    """
+    Return a copy of the cached preamble that generation may extend.
+    Legacy tuple caches are never modified in place, Cache objects are.
+    """
+    if isinstance(past_key_values, tuple):
+        return past_key_values
+    return copy.deepcopy(past_key_values)
+
+class InformationDictStoppingCriteria(StoppingCriteria):
+    """Stops generation as soon as the generated information dict of every sequence is balanced and closed."""
+
+    def __init__(self, eval_tokenizer, prompt_length):
+        """
+        Args:
+            eval_tokenizer (AutoTokenizer): Tokenizer for the evaluation model.
+            prompt_length (int): Number of prompt tokens preceding the generated ones.
+        """
+        self.eval_tokenizer = eval_tokenizer
+        self.prompt_length = prompt_length
+        self.parsers = []
+
+    @property
+    def parser(self):
+        """Parser of the first (or only) sequence."""
+        return self.parsers[0]
+
+    def feed(self, sequences):
+        """
+        Decode only the generated tokens of each sequence and feed each parser what it has not seen yet.
+
+        Args:
+            sequences (torch.Tensor): Token ids of shape (batch, length).
+
+        Returns:
+            list: Whether each sequence's information dict is closed.
+        """
+        if not self.parsers:
+            self.parsers = [InformationParser() for _ in range(sequences.shape[0])]
+        done = []
+        for parser, ids in zip(self.parsers, sequences):
+            if not parser.done:
+                text = self.eval_tokenizer.decode(ids[self.prompt_length:], skip_special_tokens=True)
+                parser.feed(text[len(parser.text):])
+            done.append(parser.done)
+        return done
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor(self.feed(input_ids), dtype=torch.bool, device=input_ids.device)
+
+def inference(ft_model, eval_tokenizer, query, prefix_cache=None, early_stop=False):
+    """
+    Perform inference to extract meta information from the user's query.
+
+    Args:
+        ft_model (PeftModel): Fine-tuned model for extracting meta information.
+        eval_tokenizer (AutoTokenizer): Tokenizer for the evaluation model.
+        query (str): User's query.
+        prefix_cache (dict, optional): Output of build_prefix_cache. If given, only the query suffix is prefilled.
+        early_stop (bool, optional): Stop generating once the information dict is closed and parse it
+            from the new tokens only. Returns the parsed dict, or None if it could not be parsed. Defaults to False.
+
+    Returns:
+        str: Extracted meta information from the query.
+    """
+    if prefix_cache is None:
+        # Encode the prompt using the evaluation tokenizer
+        model_input = eval_tokenizer(build_prompt(query), return_tensors="pt").to(ft_model.device)
+    else:
+        # Encode only the query suffix and reuse the cached preamble
+        suffix_ids = eval_tokenizer(QUERY_TEMPLATE.format(query=query), add_special_tokens=False, return_tensors="pt").input_ids.to(ft_model.device)
+        input_ids = torch.cat([prefix_cache["input_ids"], suffix_ids], dim=1)
+        model_input = {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            "past_key_values": _fresh_past(prefix_cache["past_key_values"]),
+        }
+
+    if early_stop:
+        prompt_length = model_input["input_ids"].shape[1]
+        stopping_criteria = InformationDictStoppingCriteria(eval_tokenizer, prompt_length)
+        with torch.no_grad():
+            output = ft_model.generate(**model_input, max_new_tokens=150, stopping_criteria=StoppingCriteriaList([stopping_criteria]))
+
+        # Catch up on the final token in case generation ended for another reason
+        stopping_criteria.feed(output)
+        prediction = stopping_criteria.parser.result()
+        return prediction if prediction else None
 
-    # Encode the prompt using the evaluation tokenizer
-    model_input = eval_tokenizer(infer_prompt, return_tensors="pt").to(device)
-    
     # Perform generation using the fine-tuned model
     with torch.no_grad():
         prediction = eval_tokenizer.decode(ft_model.generate(**model_input, max_new_tokens=150)[0], skip_special_tokens=True)
@@ -70,4 +176,36 @@ Now, please extract meta information from this user query:
         prediction = prediction["information"]
 
     return prediction
-        
\ No newline at end of file
+
+def batch_inference(ft_model, eval_tokenizer, queries, early_stop=True):
+    """
+    Extract meta information from several queries with one padded generate call.
+    The prompts are left-padded, so the cached preamble of build_prefix_cache is not used here.
+
+    Args:
+        ft_model (PeftModel): Fine-tuned model for extracting meta information.
+        eval_tokenizer (AutoTokenizer): Tokenizer for the evaluation model.
+        queries (list): Users' queries.
+        early_stop (bool, optional): Stop once every information dict is closed. Defaults to True.
+
+    Returns:
+        list: The parsed information dict of each query, or None if none was extracted.
+    """
+    if eval_tokenizer.pad_token is None:
+        eval_tokenizer.pad_token = eval_tokenizer.eos_token
+    padding_side = eval_tokenizer.padding_side
+    eval_tokenizer.padding_side = "left"
+    try:
+        model_input = eval_tokenizer([build_prompt(q) for q in queries], return_tensors="pt", padding=True).to(ft_model.device)
+    finally:
+        eval_tokenizer.padding_side = padding_side
+
+    prompt_length = model_input["input_ids"].shape[1]
+    stopping_criteria = InformationDictStoppingCriteria(eval_tokenizer, prompt_length)
+    generate_kwargs = {"stopping_criteria": StoppingCriteriaList([stopping_criteria])} if early_stop else {}
+    with torch.no_grad():
+        output = ft_model.generate(**model_input, max_new_tokens=150, pad_token_id=eval_tokenizer.pad_token_id, **generate_kwargs)
+
+    stopping_criteria.feed(output)
+    predictions = [parser.result() for parser in stopping_criteria.parsers]
+    return [prediction if prediction else None for prediction in predictions]
@@ -38,4 +38,74 @@ def extract_answer(prediction):
         information = preprocess(information_str)
         extracted_information["query"] = query
         extracted_information["information"] = information
-    return extracted_information
\ No newline at end of file
+    return extracted_information
+
+class InformationParser:
+    """Incrementally scans generated text for the first balanced {...} information dict."""
+
+    def __init__(self):
+        self.text = ""
+        self.start = None  # Index of the opening brace
+        self.end = None  # Index just past the matching closing brace
+        self.depth = 0
+        self.quote = None  # Quote character of the string literal being scanned, if any
+        self.escaped = False
+
+    @property
+    def done(self):
+        """Whether the information dict has been closed."""
+        return self.end is not None
+
+    def feed(self, text):
+        """
+        Append newly generated text and scan only the new characters.
+
+        Args:
+            text (str): The newly generated text.
+
+        Returns:
+            bool: True once the information dict is balanced and closed.
+        """
+        offset = len(self.text)
+        self.text += text
+        if self.done:
+            return True
+
+        for i, char in enumerate(text, offset):
+            if self.quote:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == self.quote:
+                    self.quote = None
+            elif self.start is None:
+                if char == "{":
+                    self.start = i
+                    self.depth = 1
+            elif char in "'\"":
+                self.quote = char
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = i + 1
+                    return True
+        return False
+
+    def result(self):
+        """
+        Parse the information dict.
+
+        Returns:
+            dict: The extracted information, or an empty dict if it is missing or malformed.
+        """
+        if not self.done:
+            return {}
+        try:
+            information = ast.literal_eval(self.text[self.start:self.end])
+        except (SyntaxError, ValueError) as e:
+            print(f"Error evaluating string: {e}")
+            return {}
+        return information if isinstance(information, dict) else {}
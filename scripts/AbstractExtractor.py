@@ -1,18 +1,60 @@
 # Import necessary library
+import io
 import logging
 
-# Set up basic logging configuration
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pages parsed while looking for the abstract before falling back to the heuristic
+MAX_ABSTRACT_PAGES = 3
+
+# Words kept by the heuristic fallback when the document has no "Abstract" section
+FALLBACK_WORDS = 200
+
+
+def iter_pdf_elements(path, max_pages=MAX_ABSTRACT_PAGES):
+    """Lazily partition a PDF one page at a time.
+
+    Each page is copied into an in-memory single-page PDF and partitioned on its own, so pages
+    after the point where the consumer stops iterating are never parsed.
+
+    Args:
+        path (Path): Path to the PDF file.
+        max_pages (int, optional): Maximum number of pages to parse. Defaults to MAX_ABSTRACT_PAGES.
+
+    Yields:
+        Element: The elements of the page being parsed, in reading order.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from unstructured.partition.pdf import partition_pdf
+
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages[:max_pages], 1):
+        writer = PdfWriter()
+        writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        buffer.seek(0)
+        logger.debug(f"Partitioning page {number} of {path}")
+        yield from partition_pdf(file=buffer)
+
 
 class AbstractExtractor:
-    """Extracts abstract text from a list of elements."""
+    """Extracts abstract text from a stream of elements, stopping as soon as the abstract has closed."""
+
+    def __init__(self, fallback_words=FALLBACK_WORDS):
+        """Initialize AbstractExtractor attributes.
 
-    def __init__(self):
-        """Initialize AbstractExtractor attributes."""
+        Args:
+            fallback_words (int, optional): Words kept by the fallback when no abstract section is found.
+                Defaults to FALLBACK_WORDS.
+        """
         self.current_section = None  # Keep track of the current section being processed
         self.have_extracted_abstract = False  # Keep track of whether the abstract has been extracted
         self.in_abstract_section = False  # Keep track of whether we're inside the Abstract section
         self.texts = []  # Keep track of the extracted abstract text
+        self.fallback_words = fallback_words
+        self.fallback = []  # Leading narrative text, used when there is no Abstract section
+        self.fallback_length = 0
 
     def process(self, element):
         """Process each element and extract abstract text if found.
@@ -26,16 +68,31 @@ class AbstractExtractor:
         if element.category == "Title":
             self.set_section(element.text)
 
-            if self.current_section == "Abstract":
+            if self.current_section.strip().rstrip(".:").lower() == "abstract":
                 self.in_abstract_section = True
                 return True
 
             if self.in_abstract_section:
                 return False
 
-        if self.in_abstract_section and element.category == "NarrativeText":
-            self.consume_abstract_text(element.text)
-            return True
+        if element.category == "NarrativeText":
+            if self.in_abstract_section:
+                self.consume_abstract_text(element.text)
+                return True
+
+            text = element.text.strip()
+            if text.rstrip(".:").lower() == "abstract":
+                # A heading not recognized as a title
+                self.in_abstract_section = True
+                return True
+            if text[:8].lower() == "abstract" and not text[8].isalpha():
+                # Abstracts run in with their heading, e.g. "Abstract—We propose ..."
+                self.consume_abstract_text(text[8:].lstrip(" .:—-–"))
+                return False
+
+            if self.fallback_length < self.fallback_words:
+                self.fallback.append(element.text)
+                self.fallback_length += len(element.text.split())
 
         return True
 
@@ -46,7 +103,7 @@ class AbstractExtractor:
             text (str): The text representing the current section.
         """
         self.current_section = text
-        logging.info(f"Current section: {self.current_section}")
+        logger.debug(f"Current section: {self.current_section}")
 
     def consume_abstract_text(self, text):
         """Append extracted abstract text to the texts list.
@@ -54,14 +111,20 @@ class AbstractExtractor:
         Args:
             text (str): The abstract text to be appended.
         """
-        logging.info(f"Abstract part extracted: {text}")
+        logger.debug(f"Abstract part extracted: {text}")
         self.texts.append(text)
 
-    def consume_elements(self, elements):
-        """Process a list of elements to extract abstract text.
+    def consume(self, elements):
+        """Process a stream of elements until the abstract has closed.
+
+        The stream is consumed lazily: iteration stops at the first element after the abstract,
+        so a generator such as `iter_pdf_elements` does not parse the remaining pages.
 
         Args:
-            elements (list): A list of objects representing elements.
+            elements (iterable): Objects representing elements, typically a generator.
+
+        Returns:
+            bool: True if an abstract section was found.
         """
         for element in elements:
             should_continue = self.process(element)
@@ -70,13 +133,43 @@ class AbstractExtractor:
                 self.have_extracted_abstract = True
                 break
 
+        if not self.have_extracted_abstract and self.texts:
+            # The document ended (or the page limit was hit) inside the abstract
+            self.have_extracted_abstract = True
+
         if not self.have_extracted_abstract:
-            logging.warning("No abstract found in the given list of objects.")
+            logger.debug("No abstract found in the given elements, using the leading text.")
+        return self.have_extracted_abstract
+
+    def consume_elements(self, elements):
+        """Process a list of elements to extract abstract text.
+
+        Args:
+            elements (list): A list of objects representing elements.
+        """
+        self.consume(elements)
 
     def abstract(self):
-        """Return the extracted abstract text.
+        """Return the extracted abstract text, or the leading text of the document if there was none.
 
         Returns:
             str: The extracted abstract text.
         """
+        if not self.texts:
+            return " ".join(" ".join(self.fallback).split()[:self.fallback_words])
         return "\n".join(self.texts)
+
+
+def extract_abstract(path, max_pages=MAX_ABSTRACT_PAGES):
+    """Extract the abstract of a PDF, parsing only as many pages as needed.
+
+    Args:
+        path (Path): Path to the PDF file.
+        max_pages (int, optional): Maximum number of pages to parse. Defaults to MAX_ABSTRACT_PAGES.
+
+    Returns:
+        str: The abstract, or the leading text of the document if it has no abstract section.
+    """
+    extractor = AbstractExtractor()
+    extractor.consume(iter_pdf_elements(path, max_pages))
+    return extractor.abstract()
@@ -8,6 +8,14 @@ import base64
 from pathlib import Path
 import pandas as pd
 import json
+import argparse
+import functools
+from scripts.blob_store import blob_store
+from scripts.manifest import Manifest
+from scripts.get_metadata import scan_files
+from scripts.orchestrator import (CPU_WORKERS, MAX_PIPELINES, QUEUE_BYTES, QUEUE_SIZE, IngestionOrchestrator,
+                                  load_pipelines, print_throughput)
+from scripts.passages import PASSAGE_COLLECTION
 
 def connect() -> WeaviateClient:
     """
@@ -39,6 +47,9 @@ PDFS = True
 IMAGES = True
 CSVS = True
 
+# Collections whose objects are derived from the files of another collection
+CHILD_COLLECTIONS = {'pdf': [PASSAGE_COLLECTION]}
+
 DEMO_QUERY_PDF = True
 DEMO_QUERY_IMAGES = False
 DEMO_QUERY_VIDEOS = False
@@ -93,7 +104,7 @@ def demo_query(client: WeaviateClient):
         print(" "*45 + "PDF Files")
         print("-"*100)
 
-    if DEMO_QUERY_PDF:
+    if DEMO_QUERY_PDF and client.collections.exists('pdf'):
         # Demo query for PDF files
         pdf_collection = client.collections.get('pdf')
 
@@ -110,53 +121,208 @@ def demo_query(client: WeaviateClient):
 
     return True
 
+def ingest(client: WeaviateClient, collection_name, define_collection, import_data, paths, manifest: Manifest,
+           incremental: bool = False, upsert: bool = True) -> bool:
+    """
+    Ingest the files of one collection, either from scratch or incrementally.
+
+    In incremental mode the manifest tells which files are new, changed or removed since the
+    last run: only new and changed files are (re-)vectorized, and objects of changed and removed
+    files are deleted first.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str): The name of the collection.
+        define_collection (callable): Creates the collection, e.g. define_collection_images.
+        import_data (callable): Imports files, e.g. import_data_images. Must accept `files` when `upsert` is True.
+        paths (list): Paths of the files currently on disk.
+        manifest (Manifest): The ingestion manifest, updated in place.
+        incremental (bool, optional): Only sync differences instead of re-creating the collection. Defaults to False.
+        upsert (bool, optional): Whether single files can be replaced. If False, any difference
+            re-creates the whole collection. Defaults to True.
+
+    Returns:
+        bool: True if anything was ingested or deleted.
+    """
+    if incremental and can_sync(client, collection_name):
+        new, changed, removed = manifest.diff(collection_name, paths)
+        print(f"{len(new)} new, {len(changed)} changed, {len(removed)} removed files.")
+        if not (new or changed or removed):
+            return False
+
+        if upsert:
+            apply_changes(client, collection_name, import_data, new, changed, removed, manifest)
+            return True
+
+    # Full ingestion: re-create the collection from every file
+    recreate_collection(client, collection_name, define_collection, manifest)
+    report = import_data(client, collection_name, files=paths) if upsert else import_data(client, collection_name)
+    record_ingested(manifest, collection_name, paths, report)
+    manifest.save()
+    return True
+
+def recreate_collection(client: WeaviateClient, collection_name, define_collection, manifest: Manifest) -> bool:
+    """
+    Drop a collection and its child collections, define it again and forget its files in the saved manifest.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str): The name of the collection.
+        define_collection (callable): Creates the collection, e.g. define_collection_images.
+        manifest (Manifest): The ingestion manifest, updated in place.
+
+    Returns:
+        bool: True if the collection was re-created.
+    """
+    delete_existing(collection_name, client)
+    for child in CHILD_COLLECTIONS.get(collection_name, []):
+        delete_existing(child, client)
+    define_collection(client, collection_name)
+    # Saved at once, so an interrupted import is re-done in full by the next incremental run
+    manifest.reset(collection_name)
+    manifest.save()
+    return True
+
+def can_sync(client: WeaviateClient, collection_name) -> bool:
+    """
+    Check whether a collection can be updated file by file rather than re-created.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str): The name of the collection.
+
+    Returns:
+        bool: True if the collection exists with the current schema.
+    """
+    return client.collections.exists(collection_name) and not schema_outdated(client, collection_name)
+
+def schema_outdated(client: WeaviateClient, collection_name) -> bool:
+    """
+    Check whether a collection predates the numeric 'file_size' property, in which case new
+    objects cannot be added to it and it has to be re-created.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str): The name of the collection.
+
+    Returns:
+        bool: True if the collection stores 'file_size' as text.
+    """
+    properties = {p.name: p.data_type for p in client.collections.get(collection_name).config.get().properties}
+    if properties.get("file_size") == wvc.config.DataType.TEXT:
+        print(f"'{collection_name}' stores file_size as text; re-creating it.")
+        return True
+    return False
+
+def apply_changes(client: WeaviateClient, collection_name, import_data, new, changed, removed, manifest: Manifest) -> dict:
+    """
+    Bring a collection in line with a set of file changes and save the manifest.
+    Objects of changed and removed files are deleted by filename (a video has one object per
+    segment), also from the child collections, then new and changed files are imported.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        collection_name (str): The name of the collection.
+        import_data (callable): Imports files, e.g. import_data_images; must accept `files`. If None,
+            only the deletions are applied and the caller imports and records the new and changed files.
+        new (list): Paths of new files.
+        changed (list): Paths of changed files.
+        removed (list): Paths of removed files.
+        manifest (Manifest): The ingestion manifest, updated in place.
+
+    Returns:
+        dict: The importer's report, or None if there was nothing to import.
+    """
+    collections = [client.collections.get(collection_name)]
+    collections += [client.collections.get(child) for child in CHILD_COLLECTIONS.get(collection_name, [])
+                    if client.collections.exists(child)]
+    for path in changed + removed:
+        for collection in collections:
+            collection.data.delete_many(where=wvc.query.Filter("filename").equal(path.name))
+    for path in removed:
+        manifest.remove(collection_name, path)
+    files = new + changed
+    if import_data is None:
+        manifest.save()
+        return None
+    report = import_data(client, collection_name, files=files) if files else None
+    record_ingested(manifest, collection_name, files, report)
+    manifest.save()
+    return report
+
+def record_ingested(manifest: Manifest, collection_name, paths, report):
+    """
+    Record the files that made it into Weaviate in the manifest.
+
+    Args:
+        manifest (Manifest): The ingestion manifest.
+        collection_name (str): The name of the collection.
+        paths (list): The files that were imported.
+        report (dict): The importer's report; files listed in its 'failed_objects' are skipped.
+    """
+    failed = set(report.get("failed_objects", [])) if isinstance(report, dict) else set()
+    for path in paths:
+        if path.name not in failed:
+            manifest.record(collection_name, path)
+
 def main():
+    parser = argparse.ArgumentParser(description="Ingest local files into Weaviate.")
+    default_modalities = [name for name, enabled in
+                          (("images", IMAGES), ("csv", CSVS), ("pdf", PDFS), ("videos", VIDEOS)) if enabled]
+    parser.add_argument("--modalities", nargs="+", choices=["images", "csv", "pdf", "videos"],
+                        default=default_modalities, help="modalities to ingest")
+    parser.add_argument("--data-dir", default="data", help="directory holding images/, pdf/, videos/ and the CSV")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ingest new and changed files and delete removed ones, based on the manifest")
+    parser.add_argument("--max-pipelines", type=int, default=MAX_PIPELINES,
+                        help="modalities processed at the same time")
+    parser.add_argument("--cpu-workers", type=int, default=CPU_WORKERS, help="processes parsing PDFs")
+    parser.add_argument("--layout", action="store_true",
+                        help="find PDF abstracts by partitioning the page layout instead of reading the text layer")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="objects buffered between the pipelines and the writer")
+    parser.add_argument("--queue-mb", type=float, default=QUEUE_BYTES / 2**20,
+                        help="payload MiB buffered between the pipelines and the writer")
+    args = parser.parse_args()
+
     # Connect to Weaviate
     client = connect()
+    # Stat every data file once; importers and the manifest read sizes and dates from this table
+    files = scan_files(args.data_dir)
+    manifest = Manifest()
+    data_dir = Path(args.data_dir)
 
-    # Define and import collections, and perform demo queries based on user preferences
-    print('-'*100)
-    print("Ingesting Images")
-    print('-'*100)
-    if IMAGES:
-        # Images
-        from create_collections.Images import define_collection_images, import_data_images
-        delete_existing('images', client)
-        define_collection_images(client)
-        import_data_images(client)
-
-    print('-'*100)
-    print("Ingesting CSVs")
-    print('-'*100)
-    if CSVS:
-        # Wines -- csv
+    csv_path = data_dir / "wine_reviews.csv"
+    if "csv" in args.modalities and not csv_path.exists():
+        print(f"No {csv_path}; skipping CSVs.")
+    elif "csv" in args.modalities:
+        print('-'*100)
+        print("Ingesting CSVs")
+        print('-'*100)
+        # Wines -- csv; small, and re-created as a whole on any change
         from create_collections.Wines import define_collection_wine_reviews, import_data_wine_reviews
-        delete_existing('WineReviews', client)
-        define_collection_wine_reviews(client)
-        import_data_wine_reviews(client)
+        import_data = functools.partial(import_data_wine_reviews, path=csv_path)
+        ingest(client, 'WineReviews', define_collection_wine_reviews, import_data, [csv_path], manifest,
+               args.incremental, upsert=False)
 
+    # Images, PDFs and videos are parsed and vectorized concurrently and written by a single writer
+    pipelines = load_pipelines(data_dir, args.cpu_workers, fast=not args.layout)
+    pipelines = {name: pipeline for name, pipeline in pipelines.items() if name in args.modalities}
     print('-'*100)
-    print("Ingesting PDFs")
+    print(f"Ingesting {', '.join(pipelines)}")
     print('-'*100)
-    if PDFS:
-        # Pdfs
-        from create_collections.PDF import define_collection_pdfs, import_data_pdf
-        delete_existing('pdf', client)
-        define_collection_pdfs(client, 'pdf')
-        import_data_pdf(client)
+    orchestrator = IngestionOrchestrator(client, manifest, pipelines, args.queue_size, args.max_pipelines,
+                                         int(args.queue_mb * 2**20))
+    paths = {name: files.paths(pipeline["type"], pipeline["directory"]) for name, pipeline in pipelines.items()}
+    report = orchestrator.run(paths, files, args.incremental)
+    print_throughput(report)
 
-    print('-'*100)
-    print("Ingesting Videos")
-    print('-'*100)
-    if VIDEOS:
-        # Videos
-        from create_collections.Videos import define_collection_videos, import_data_videos
-        delete_existing('videos', client)
-        define_collection_videos(client, 'videos')
-        import_data_videos(client)
+    # Drop the stored media of removed and changed files
+    print(f"Deleted {blob_store.collect(manifest)} unreferenced blobs.")
 
     # Perform demo query
     demo_query(client)
+    client.close()
 
 if __name__ == "__main__":
     main()
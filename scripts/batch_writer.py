@@ -0,0 +1,122 @@
+import time
+
+# Default batch limits: whichever is hit first closes the batch
+BATCH_SIZE = 32
+BATCH_BYTES = 32 * 1024 * 1024
+
+# Attempts per batch before its remaining objects are reported as failed
+RETRIES = 3
+BACKOFF = 1.0  # Seconds, doubled after every failed attempt
+
+
+def object_size(data_obj):
+    """
+    Estimate the request size of a data object from its string properties (base64 blobs dominate)
+    and its vector, if it brings one.
+
+    Args:
+        data_obj (DataObject): The object to measure.
+
+    Returns:
+        int: Approximate size in bytes.
+    """
+    size = sum(len(v) for v in data_obj.properties.values() if isinstance(v, str))
+    return size + 8 * len(data_obj.vector or [])
+
+
+def batched(data_objs, max_objects=BATCH_SIZE, max_bytes=BATCH_BYTES):
+    """
+    Group a stream of data objects into batches bounded by count and by bytes.
+    Only one batch is held in memory at a time.
+
+    Args:
+        data_objs (iterable): The data objects, typically a generator.
+        max_objects (int, optional): Maximum number of objects per batch. Defaults to BATCH_SIZE.
+        max_bytes (int, optional): Maximum estimated bytes per batch. Defaults to BATCH_BYTES.
+
+    Yields:
+        list: A batch of data objects.
+    """
+    batch, batch_bytes = [], 0
+    for data_obj in data_objs:
+        size = object_size(data_obj)
+        if batch and (len(batch) >= max_objects or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(data_obj)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def insert_batch(collection, batch, retries=RETRIES, backoff=BACKOFF):
+    """
+    Insert one batch, retrying the whole batch on request failures and only the
+    failed objects on per-object errors.
+
+    Args:
+        collection: The Weaviate collection to insert into.
+        batch (list): The data objects.
+        retries (int, optional): Number of attempts. Defaults to RETRIES.
+        backoff (float, optional): Initial delay between attempts in seconds. Defaults to BACKOFF.
+
+    Returns:
+        tuple: The number of inserted objects and a list of (object, error message) pairs.
+    """
+    pending = batch
+    errors = []
+    inserted = 0
+    for attempt in range(retries):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            response = collection.data.insert_many(pending)
+        except Exception as e:
+            errors = [(data_obj, str(e)) for data_obj in pending]
+            continue
+        inserted += len(pending) - len(response.errors)
+        errors = [(pending[i], e.message) for i, e in response.errors.items()]
+        pending = [data_obj for data_obj, _ in errors]
+        if not pending:
+            break
+    return inserted, errors
+
+
+def insert_batches(collection, batches, retries=RETRIES, backoff=BACKOFF, label=lambda data_obj: str(data_obj.uuid)):
+    """
+    Insert a stream of batches and report the outcome. A failing batch does not affect the others.
+
+    Args:
+        collection: The Weaviate collection to insert into.
+        batches (iterable): Batches of data objects, see `batched`.
+        retries (int, optional): Number of attempts per batch. Defaults to RETRIES.
+        backoff (float, optional): Initial delay between attempts in seconds. Defaults to BACKOFF.
+        label (callable, optional): Names an object in error reports. Defaults to its uuid.
+
+    Returns:
+        dict: Counts of batches, inserted and failed objects, the labels of the failed objects
+            and the error messages.
+    """
+    report = {"batches": 0, "inserted": 0, "failed": 0, "failed_objects": [], "errors": []}
+    for batch in batches:
+        inserted, errors = insert_batch(collection, batch, retries, backoff)
+        report["batches"] += 1
+        report["inserted"] += inserted
+        report["failed"] += len(errors)
+        report["failed_objects"].extend(label(data_obj) for data_obj, _ in errors)
+        report["errors"].extend(f"{label(data_obj)}: {message}" for data_obj, message in errors)
+        print(f"Batch {report['batches']}: {inserted} inserted, {len(errors)} failed.")
+    return report
+
+
+def print_report(report):
+    """
+    Print an ingestion report in the format used by the importers.
+
+    Args:
+        report (dict): Output of `insert_batches`.
+    """
+    print(f"{report['inserted']} insertions complete.")
+    print(f"{report['failed']} errors within.")
+    for e in report["errors"]:
+        print(e)
@@ -0,0 +1,123 @@
+import argparse
+import ast
+import json
+import multiprocessing
+import resource
+import statistics
+import time
+
+import psutil
+
+# Labelled queries in the fine-tuning format: [{"input": query, "output": "{...}"}, ...]
+TEST_DATA = "fine_tune/data/query_test.json"
+
+DATE_KEYS = ("year", "month", "day")
+
+
+def score_prediction(prediction, label):
+    """
+    Compare an extracted information dict with its label.
+
+    Args:
+        prediction (dict or str): The extracted information, None if nothing was extracted.
+        label (dict): The ground truth information.
+
+    Returns:
+        dict: Whether the prediction parsed, whether the dates match exactly,
+            and the Jaccard overlap of the file types.
+    """
+    if not isinstance(prediction, dict):
+        return {"parsed": 0, "date_match": 0, "file_type_overlap": 0.0}
+    predicted_types = set(prediction.get("file type", []))
+    label_types = set(label.get("file type", []))
+    union = predicted_types | label_types
+    return {
+        "parsed": 1,
+        "date_match": int(all(prediction.get(k) == label.get(k) for k in DATE_KEYS)),
+        "file_type_overlap": len(predicted_types & label_types) / len(union) if union else 1.0,
+    }
+
+
+def run_backend(backend, samples):
+    """
+    Load one backend and time it on the samples. Runs in its own process so RSS is not shared.
+
+    Args:
+        backend (str): The backend name, see get_llama_inference.BACKENDS.
+        samples (list): The labelled queries.
+
+    Returns:
+        dict: Load time, RSS, latency percentiles, extraction accuracy and the number of samples skipped
+            because their label does not parse.
+    """
+    from inference import inference
+    from scripts.get_llama_inference import EARLY_STOP, load_model
+
+    start = time.perf_counter()
+    loaded = load_model(backend)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = psutil.Process().memory_info().rss
+
+    latencies, scores = [], []
+    unscored = 0
+    for sample in samples:
+        try:
+            label = ast.literal_eval(sample["output"])
+        except (SyntaxError, ValueError):
+            # Some labels of the test set are not valid literals, e.g. unescaped apostrophes
+            unscored += 1
+            continue
+        start = time.perf_counter()
+        prediction = inference.inference(loaded["model"], loaded["tokenizer"], sample["input"],
+                                         prefix_cache=loaded["prefix_cache"], early_stop=EARLY_STOP)
+        latencies.append(time.perf_counter() - start)
+        if isinstance(prediction, str) and prediction.strip():
+            # The non early-stop path returns the dict literal as a string
+            try:
+                prediction = ast.literal_eval(prediction)
+            except (SyntaxError, ValueError):
+                pass
+        scores.append(score_prediction(prediction, label))
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_s": load_seconds,
+        "rss_mb": rss_loaded / 2**20,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        "latency_mean_s": statistics.mean(latencies),
+        "latency_p50_s": latencies[len(latencies) // 2],
+        "latency_p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "parse_rate": statistics.mean(s["parsed"] for s in scores),
+        "date_accuracy": statistics.mean(s["date_match"] for s in scores),
+        "file_type_overlap": statistics.mean(s["file_type_overlap"] for s in scores),
+        "unscored": unscored,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TinyLlama inference backends on labelled queries.")
+    parser.add_argument("--data", default=TEST_DATA, help="JSON list of {'input', 'output'} records")
+    parser.add_argument("--limit", type=int, default=20, help="number of queries to run per backend")
+    parser.add_argument("--backends", nargs="+", default=["peft", "int8"])
+    args = parser.parse_args()
+
+    with open(args.data, "r") as f:
+        samples = json.load(f)[:args.limit]
+
+    # A fresh process per backend keeps the memory measurements independent
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backends:
+        print(f"Benchmarking {backend} on {len(samples)} queries...")
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_backend, (backend, samples)))
+
+    columns = list(results[0].keys())
+    print("\t".join(columns))
+    for result in results:
+        print("\t".join(f"{v:.3f}" if isinstance(v, float) else str(v) for v in result.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+from scripts.manifest import file_hash
+
+# Where media files are stored, addressed by the SHA-256 of their content
+BLOB_DIR = Path(".cache/blobs")
+
+# "reference" stores images and videos here and only their path and hash in Weaviate, with vectors
+# computed at ingestion; "blob" stores them base64-encoded in Weaviate as before
+MEDIA_STORAGE = os.environ.get("MEDIA_STORAGE", "reference")
+
+# Seconds a new blob is kept even if no manifest entry references it yet, so that blobs of an
+# ingestion still running in another process are not collected
+GC_GRACE = 3600
+
+
+class BlobStore:
+    """Content-addressed store of media files on local disk."""
+
+    def __init__(self, root=BLOB_DIR):
+        """
+        Args:
+            root (Path, optional): Directory holding the blobs. Defaults to BLOB_DIR.
+        """
+        self.root = Path(root)
+
+    def path(self, digest, suffix=""):
+        """
+        Return where the blob with a given hash is stored.
+
+        Args:
+            digest (str): The SHA-256 hex digest of the content.
+            suffix (str, optional): The file extension, kept so the type of the blob is known. Defaults to "".
+
+        Returns:
+            Path: The blob path, which may not exist.
+        """
+        return self.root / digest[:2] / (digest + suffix)
+
+    def put(self, path, digest=None):
+        """
+        Add a file to the store as a hard link, so it takes no extra disk space, or as a copy if
+        the store is on another filesystem. Identical content is stored once.
+
+        Args:
+            path (Path): The file to store.
+            digest (str, optional): Its SHA-256, if already known. Defaults to the digest computed by
+                the manifest, see `file_hash`.
+
+        Returns:
+            str: The hex digest addressing the blob.
+        """
+        path = Path(path)
+        digest = digest or file_hash(path)
+        target = self.path(digest, path.suffix.lower())
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_suffix(target.suffix + ".tmp")
+            tmp.unlink(missing_ok=True)
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+        return digest
+
+    def get(self, digest, suffix=""):
+        """
+        Find a stored blob.
+
+        Args:
+            digest (str): The SHA-256 hex digest of the content.
+            suffix (str, optional): The file extension. Defaults to "".
+
+        Returns:
+            Path: The blob path, or None if it is not in the store.
+        """
+        target = self.path(digest, suffix)
+        return target if target.exists() else None
+
+
+    def collect(self, manifest, grace=GC_GRACE):
+        """
+        Delete the blobs no manifest entry references anymore, e.g. of removed or changed files.
+
+        Args:
+            manifest (Manifest): The ingestion manifest; reloaded under its lock first.
+            grace (float, optional): Seconds during which new blobs are kept anyway. Defaults to GC_GRACE.
+
+        Returns:
+            int: The number of blobs deleted.
+        """
+        if not self.root.exists():
+            return 0
+        deleted = 0
+        now = time.time()
+        referenced = manifest.hashes()
+        for blob in self.root.glob("*/*"):
+            digest = blob.name.split(".")[0]
+            if digest in referenced or now - blob.stat().st_ctime < grace:
+                continue
+            blob.unlink(missing_ok=True)
+            deleted += 1
+        return deleted
+
+
+# Process-wide blob store shared by the importers and the app
+blob_store = BlobStore()
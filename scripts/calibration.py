@@ -0,0 +1,269 @@
+import argparse
+import heapq
+import itertools
+import json
+import math
+import os
+from pathlib import Path
+from threading import Lock
+
+import weaviate.classes as wvc
+
+from scripts.fusion import RRF_K
+from scripts.passages import PASSAGE_COLLECTION
+from scripts.query_cache import QUERY_LOG, read_query_log
+
+# Where the per-collection score distributions are stored
+CALIBRATION_PATH = Path(".cache/calibration.json")
+
+# Scores observed before a distribution is trusted; rank-based scores are used until then
+MIN_SAMPLES = 200
+
+# Online updates between two writes of the calibration file
+SAVE_EVERY = 20
+
+# Results requested per collection once scores are calibrated; the distributions are learned on
+# this many top results, so fitting and searching must use the same value
+RESULTS_PER_COLLECTION = 50
+
+# Queries embedded per request to the inference container when fitting
+FIT_BATCH_SIZE = 64
+
+
+def normal_cdf(z):
+    return 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
+
+
+class ScoreCalibrator:
+    """
+    Learns the distribution of raw scores returned by each collection and retrieval mode
+    (running mean and variance, Welford's algorithm) and maps raw scores to comparable ones:
+    the fraction of that collection's typical results a hit beats, under a normal approximation.
+    """
+
+    def __init__(self, path=CALIBRATION_PATH, min_samples=MIN_SAMPLES):
+        """
+        Load the learned distributions, or start without any.
+
+        Args:
+            path (Path, optional): Path to the calibration file. Defaults to CALIBRATION_PATH.
+            min_samples (int, optional): Samples needed before calibrating a collection. Defaults to MIN_SAMPLES.
+        """
+        self.path = Path(path)
+        self.min_samples = min_samples
+        self.stats = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.lock = Lock()
+        self.updates = 0
+
+    def update(self, collection, mode, scores):
+        """
+        Add observed raw scores to the distribution of a collection.
+
+        Args:
+            collection (str): The collection name.
+            mode (str): 'vector' or 'bm25'.
+            scores (list): Raw scores, higher is better.
+        """
+        with self.lock:
+            n, mean, m2 = self.stats.get(f"{collection}/{mode}", (0, 0.0, 0.0))
+            for x in scores:
+                n += 1
+                delta = x - mean
+                mean += delta / n
+                m2 += delta * (x - mean)
+            self.stats[f"{collection}/{mode}"] = (n, mean, m2)
+            self.updates += 1
+            save = self.updates % SAVE_EVERY == 0
+        if save:
+            self.save()
+
+    def is_calibrated(self, collection, mode):
+        """
+        Check whether enough scores of a collection have been observed to calibrate it.
+
+        Args:
+            collection (str): The collection name.
+            mode (str): 'vector' or 'bm25'.
+
+        Returns:
+            bool: True if its distribution is trusted.
+        """
+        n, _, m2 = self.stats.get(f"{collection}/{mode}", (0, 0.0, 0.0))
+        return n >= self.min_samples and m2 > 0
+
+    def calibrate(self, collection, mode, score):
+        """
+        Map a raw score to a calibrated score in [0, 1].
+
+        Args:
+            collection (str): The collection name.
+            mode (str): 'vector' or 'bm25'.
+            score (float): The raw score, higher is better.
+
+        Returns:
+            float: The calibrated score, or the raw score if the collection is not calibrated yet.
+        """
+        if not self.is_calibrated(collection, mode):
+            return score
+        n, mean, m2 = self.stats[f"{collection}/{mode}"]
+        std = math.sqrt(m2 / (n - 1))
+        return normal_cdf((score - mean) / std)
+
+    def calibrate_lists(self, hit_lists, learn=True, k=RRF_K):
+        """
+        Replace the raw scores of single-mode hits of several collections with comparable scores,
+        then learn from the raw scores. Calibrated scores are only used if every collection is
+        calibrated; otherwise all of them get rank-based scores, (k + 1) / (k + rank), so unbounded
+        raw scores are never merged with calibrated ones.
+
+        Args:
+            hit_lists (list): Lists of SearchHits, one per collection, with raw scores.
+            learn (bool, optional): Add the raw scores to the distributions. Defaults to True.
+            k (int, optional): Rank offset of the rank-based scores. Defaults to RRF_K.
+
+        Returns:
+            list: The same lists, each best first.
+        """
+        keys = [(hits[0].collection, 'vector' if hits[0].metadata.distance is not None else 'bm25')
+                if hits else None for hits in hit_lists]
+        calibrated = all(self.is_calibrated(*key) for key in keys if key is not None)
+        result = []
+        for hits, key in zip(hit_lists, keys):
+            if key is None:
+                result.append(hits)
+                continue
+            hits = sorted(hits, key=lambda h: h.score, reverse=True)
+            raw = [h.score for h in hits]
+            for rank, h in enumerate(hits, 1):
+                h.score = self.calibrate(*key, h.score) if calibrated else (k + 1) / (k + rank)
+            if learn:
+                self.update(*key, raw)
+            result.append(sorted(hits, key=lambda h: h.score, reverse=True))
+        return result
+
+    def summary(self):
+        """
+        Return the learned distributions.
+
+        Returns:
+            dict: "collection/mode" -> {"n", "mean", "std"}.
+        """
+        with self.lock:
+            return {key: {"n": n, "mean": mean, "std": math.sqrt(m2 / (n - 1)) if n > 1 else 0.0}
+                    for key, (n, mean, m2) in self.stats.items()}
+
+    def reset(self):
+        """Forget every learned distribution."""
+        with self.lock:
+            self.stats = {}
+
+    def save(self):
+        """Write the distributions atomically."""
+        with self.lock:
+            data = json.dumps(self.stats)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(data)
+        os.replace(tmp, self.path)
+
+
+def top_k(hit_lists, k):
+    """
+    Merge per-collection hits into the k best by calibrated score, with a heap.
+
+    Args:
+        hit_lists (list): Lists of SearchHits.
+        k (int): Number of hits to keep.
+
+    Returns:
+        list: The k best SearchHits, best first.
+    """
+    return heapq.nlargest(k, itertools.chain.from_iterable(hit_lists), key=lambda h: h.score)
+
+
+def iter_query_vectors(queries, batch_size=FIT_BATCH_SIZE):
+    """
+    Embed queries in batches, bypassing the query embedding cache used by live searches.
+
+    Args:
+        queries (list): Query texts.
+        batch_size (int, optional): Queries per vectorization request. Defaults to FIT_BATCH_SIZE.
+
+    Yields:
+        tuple: A query and its vector. Queries of a batch that could not be embedded are skipped.
+    """
+    from scripts.query_embedding import vectorize
+
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        try:
+            vectors = vectorize({"texts": batch}, timeout=60)["textVectors"]
+        except Exception as e:
+            print(f"Failed to embed queries {start + 1}-{start + len(batch)}: {e}")
+            continue
+        yield from zip(batch, vectors)
+
+
+def fit(client, calibrator, queries, collections, limit=RESULTS_PER_COLLECTION):
+    """
+    Learn the score distributions offline by running logged queries against the indexed data.
+
+    Args:
+        client (WeaviateClient): The Weaviate client.
+        calibrator (ScoreCalibrator): The calibrator to train.
+        queries (list): Query texts, e.g. from the query log.
+        collections (list): Names of the collections to calibrate.
+        limit (int, optional): Results per query and collection. Defaults to RESULTS_PER_COLLECTION.
+    """
+    from scripts.fusion import raw_score
+
+    for i, (query, vector) in enumerate(iter_query_vectors(queries), 1):
+        for collection in collections:
+            collection_obj = client.collections.get(collection)
+            response = collection_obj.query.near_vector(
+                near_vector=vector, return_properties=["filename"], limit=limit,
+                return_metadata=wvc.query.MetadataQuery(distance=True))
+            calibrator.update(collection, 'vector', [raw_score(o) for o in response.objects])
+            response = collection_obj.query.bm25(
+                query=query, return_properties=["filename"], limit=limit,
+                return_metadata=wvc.query.MetadataQuery(score=True))
+            calibrator.update(collection, 'bm25', [raw_score(o) for o in response.objects])
+        print(f"[{i}/{len(queries)}] {query}")
+    calibrator.save()
+
+
+# Process-wide calibrator shared by all sessions
+calibrator = ScoreCalibrator()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate search scores across collections.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    fit_parser = subparsers.add_parser("fit", help="learn the score distributions from a query log")
+    fit_parser.add_argument("log", nargs="?", default=QUERY_LOG, help="query log (.txt, one query per line, or .json)")
+    fit_parser.add_argument("--collections", nargs="+", default=["images", "pdf", PASSAGE_COLLECTION, "videos"])
+    fit_parser.add_argument("--top", type=int, default=None, help="only use the N most frequent queries")
+    fit_parser.add_argument("--limit", type=int, default=RESULTS_PER_COLLECTION, help="results per query and collection")
+    subparsers.add_parser("show", help="print the learned distributions")
+    subparsers.add_parser("reset", help="forget the learned distributions")
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        from scripts.add_data import connect
+        client = connect()
+        try:
+            # The passage collection only exists when PDFs are indexed as passages
+            collections = [c for c in args.collections if client.collections.exists(c)]
+            fit(client, calibrator, read_query_log(args.log)[:args.top], collections, args.limit)
+        finally:
+            client.close()
+        print(json.dumps(calibrator.summary(), indent=1))
+    elif args.command == "show":
+        print(json.dumps(calibrator.summary(), indent=1))
+    elif args.command == "reset":
+        calibrator.reset()
+        calibrator.save()
+
+
+if __name__ == "__main__":
+    main()
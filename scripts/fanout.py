@@ -0,0 +1,74 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import time
+
+# Upper bound on concurrent Weaviate requests issued by a single process
+MAX_WORKERS = 8
+
+# Seconds each task gets to answer, counted from when it starts running, before its results are dropped
+COLLECTION_TIMEOUT = 5.0
+
+# Seconds a task may wait for a free worker before it is dropped, e.g. when several sessions search at once
+QUEUE_TIMEOUT = 5.0
+
+# Shared pool so every search reuses the same worker threads
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fanout")
+
+
+def fan_out(tasks, query_fn, timeout=COLLECTION_TIMEOUT, queue_timeout=QUEUE_TIMEOUT):
+    """
+    Run queries concurrently, e.g. one per collection, retrieval mode and query vector.
+
+    All queries are submitted at once, so the total latency tracks the slowest
+    query rather than the sum of all of them. The timeout of a query counts from when
+    a worker picks it up, so queries queued behind others are not dropped before they
+    start. Queries that do not start within `queue_timeout`, do not answer within the
+    timeout, or raise, are left out of the results.
+
+    Args:
+        tasks (list): Hashable task descriptions, e.g. (collection, mode, vector index) tuples.
+        query_fn (callable): Function taking a task and returning its response objects.
+        timeout (float, optional): Seconds a running task gets to answer. Defaults to COLLECTION_TIMEOUT.
+        queue_timeout (float, optional): Seconds a task may wait for a worker. Defaults to QUEUE_TIMEOUT.
+
+    Returns:
+        tuple: A dict mapping each task to its response objects (in the order of
+            `tasks`), and a list of the tasks that timed out or failed.
+    """
+    submitted = time.monotonic()
+    started = {}  # Task -> time a worker picked it up
+
+    def run(task):
+        started[task] = time.monotonic()
+        return query_fn(task)
+
+    def deadline(task):
+        return started[task] + timeout if task in started else submitted + queue_timeout
+
+    futures = {task: _executor.submit(run, task) for task in tasks}
+    while True:
+        now = time.monotonic()
+        waiting = {task: future for task, future in futures.items() if not future.done() and now < deadline(task)}
+        if not waiting:
+            break
+        wait(waiting.values(), timeout=min(deadline(task) for task in waiting) - now, return_when=FIRST_COMPLETED)
+
+    results = {}
+    missing = []
+    for task, future in futures.items():
+        if not future.done():
+            # Drop the straggler; a queued task is cancelled, a running one is simply ignored
+            future.cancel()
+            if task in started:
+                logging.warning(f"Query {task} timed out after {timeout}s")
+            else:
+                logging.warning(f"Query {task} did not start within {queue_timeout}s")
+            missing.append(task)
+            continue
+        try:
+            results[task] = future.result()
+        except Exception as e:
+            logging.warning(f"Query {task} failed: {e}")
+            missing.append(task)
+
+    return results, missing
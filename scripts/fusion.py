@@ -0,0 +1,138 @@
+import heapq
+
+# Rank offset of reciprocal-rank fusion; larger values flatten the head of each list
+RRF_K = 60
+
+# Weight of the vector ranking against the keyword ranking in hybrid searches
+ALPHA = 0.5
+
+
+class SearchHit:
+    """
+    A search result with the collection it came from and a relevance score, higher is better.
+    Exposes the `uuid`, `properties` and `metadata` of the underlying Weaviate object.
+    """
+
+    __slots__ = ("obj", "collection", "score", "ranks", "highlights")
+
+    def __init__(self, obj, collection, score, ranks=None, highlights=None):
+        """
+        Args:
+            obj (Object): The Weaviate object.
+            collection (str): The collection it was retrieved from.
+            score (float): Its relevance score.
+            ranks (dict, optional): Retrieval mode -> 1-based rank in that mode's results. Defaults to None.
+            highlights (list, optional): Properties of the best matching passages of a document. Defaults to None.
+        """
+        self.obj = obj
+        self.collection = collection
+        self.score = score
+        self.ranks = ranks or {}
+        self.highlights = highlights or []
+
+    @property
+    def uuid(self):
+        return self.obj.uuid
+
+    @property
+    def properties(self):
+        return self.obj.properties
+
+    @property
+    def metadata(self):
+        return self.obj.metadata
+
+    def __repr__(self):
+        return f"SearchHit({self.collection}, {self.properties.get('filename')!r}, score={self.score:.4f})"
+
+
+def raw_score(obj):
+    """
+    Score a single-mode result: cosine similarity for vector searches, the BM25 score otherwise.
+
+    Args:
+        obj (Object): The Weaviate object, with its distance or score metadata.
+
+    Returns:
+        float: The score, higher is better.
+    """
+    if obj.metadata.distance is not None:
+        return 1.0 - obj.metadata.distance
+    return obj.metadata.score or 0.0
+
+
+def hits_from_objects(objects, collection):
+    """
+    Wrap the results of a single retrieval mode.
+
+    Args:
+        objects (list): The response objects, best first.
+        collection (str): The collection they were retrieved from.
+
+    Returns:
+        list: SearchHits, best first.
+    """
+    return [SearchHit(o, collection, raw_score(o)) for o in objects]
+
+
+def rrf_fuse(rankings, collection, alpha=ALPHA, k=RRF_K):
+    """
+    Fuse the keyword and vector rankings of one collection with weighted reciprocal-rank fusion.
+    The score of an object is the sum over rankings of weight / (k + rank), scaled so that an object
+    ranked first by both modes scores 1. Scores only depend on ranks, so they are comparable across
+    collections.
+
+    Args:
+        rankings (dict): 'bm25' and/or 'vector' -> response objects, best first.
+        collection (str): The collection the objects were retrieved from.
+        alpha (float, optional): Weight of the vector ranking; the keyword ranking gets 1 - alpha. Defaults to ALPHA.
+        k (int, optional): The RRF rank offset. Defaults to RRF_K.
+
+    Returns:
+        list: SearchHits, best first.
+    """
+    weights = {'bm25': 1.0 - alpha, 'vector': alpha}
+    hits = {}
+    for mode, objects in rankings.items():
+        for rank, obj in enumerate(objects, 1):
+            hit = hits.get(obj.uuid)
+            if hit is None:
+                hit = hits[obj.uuid] = SearchHit(obj, collection, 0.0)
+            elif obj.metadata.distance is not None:
+                # Keep the copy carrying the vector distance
+                hit.obj = obj
+            hit.ranks[mode] = rank
+            hit.score += weights[mode] * (k + 1) / (k + rank)
+    return sorted(hits.values(), key=lambda h: h.score, reverse=True)
+
+
+def collapse_by_filename(hits):
+    """
+    Keep the best hit of each file, e.g. the best matching segment of each video, whose
+    properties (start time) then stand for the file.
+
+    Args:
+        hits (list): SearchHits of one collection.
+
+    Returns:
+        list: One SearchHit per filename, best first.
+    """
+    best = {}
+    for hit in sorted(hits, key=lambda h: h.score, reverse=True):
+        best.setdefault(hit.properties.get("filename"), hit)
+    return list(best.values())
+
+
+def merge_hits(hit_lists, limit=None):
+    """
+    Merge per-collection rankings into one ranking by score.
+
+    Args:
+        hit_lists (list): Lists of SearchHits, each sorted best first.
+        limit (int, optional): Number of hits to keep. Defaults to all.
+
+    Returns:
+        list: SearchHits, best first.
+    """
+    merged = heapq.merge(*hit_lists, key=lambda h: -h.score)
+    return list(merged if limit is None else (h for _, h in zip(range(limit), merged)))
@@ -1,36 +1,158 @@
-from peft import PeftModel, PeftConfig
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from inference import inference
-import torch
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from scripts.model_registry import ModelRegistry
+from scripts.query_cache import QueryCache, log_query
 
-# Check if GPU is available and choose the device accordingly
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Base model and fine-tuned adapter; the cache is keyed on both
+BASE_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+ADAPTER_MODEL = "HongxuanLi/TinyLLaMA-RS"
+ADAPTER_REVISION = "main"
 
-# Load the configuration for the PEFT model
-config = PeftConfig.from_pretrained("HongxuanLi/TinyLLaMA-RS")
+def resolve_revision(repo_id, revision, timeout=5):
+    """
+    Resolve a branch or tag of a Hugging Face repository to its commit hash, so that cache entries
+    are tied to the exact adapter weights. Falls back to the commit recorded in the local Hugging
+    Face cache when the Hub cannot be reached.
 
-# Load the pre-trained model for chat generation
-model = AutoModelForCausalLM.from_pretrained("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+    Args:
+        repo_id (str): The model repository.
+        revision (str): A branch, tag or commit hash.
+        timeout (float, optional): Seconds to wait for the Hub. Defaults to 5.
 
-# Wrap the pre-trained model with PEFT for fine-tuning
-model = PeftModel.from_pretrained(model, "HongxuanLi/TinyLLaMA-RS").to(device)
+    Returns:
+        str: The commit hash, or `revision` itself if it cannot be resolved.
+    """
+    if re.fullmatch(r"[0-9a-f]{40}", revision):
+        return revision
+    try:
+        from huggingface_hub import HfApi
+        return HfApi().model_info(repo_id, revision=revision, timeout=timeout).sha
+    except Exception:
+        pass
+    try:
+        from huggingface_hub.constants import HF_HUB_CACHE
+        ref = Path(HF_HUB_CACHE) / f"models--{repo_id.replace('/', '--')}" / "refs" / revision
+        return ref.read_text().strip()
+    except Exception:
+        return revision
 
-# Load the tokenizer for the pre-trained model
-tokenizer = AutoTokenizer.from_pretrained(
-    "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
-    add_bos_token=True,  # Add beginning of sequence token
-    trust_remote_code=True  # Trust remote code (if necessary)
-)
+@lru_cache(maxsize=1)
+def adapter_commit():
+    """
+    Commit the adapter is loaded from and the cache is keyed on, resolved on first use
+    so that importing this module does not contact the Hub.
 
-def get_llama_inference(query):
+    Returns:
+        str: The commit hash of ADAPTER_REVISION, or ADAPTER_REVISION if it cannot be resolved.
     """
-    Get inference from the TinyLLaMA model.
+    return resolve_revision(ADAPTER_MODEL, ADAPTER_REVISION)
+
+# Encode the constant few-shot preamble once at load and prefill only the query per request
+PREFIX_CACHE = True
+
+# Stop generating once the information dict is closed
+EARLY_STOP = True
+
+# Inference backend: "peft" runs the fp32 base model with the LoRA adapter on top,
+# "int8" merges the adapter into the base weights and quantizes the linear layers for CPU hosts
+BACKENDS = ("peft", "int8")
+BACKEND = os.environ.get("LLAMA_BACKEND", "peft")
+
+def load_model(backend=BACKEND):
+    """
+    Load the fine-tuned TinyLLaMA model and its tokenizer.
+    The heavy imports happen here so that importing this module stays cheap.
+
+    Args:
+        backend (str, optional): One of BACKENDS. Defaults to BACKEND.
+
+    Returns:
+        dict: The model, the tokenizer and the cached preamble (or None).
+    """
+    from peft import PeftModel, PeftConfig
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from inference import inference
+    import torch
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    # Check if GPU is available and choose the device accordingly; the int8 backend is CPU-only
+    device = torch.device("cuda" if torch.cuda.is_available() and backend == "peft" else "cpu")
+
+    # Load the configuration for the PEFT model
+    config = PeftConfig.from_pretrained(ADAPTER_MODEL, revision=adapter_commit())
+
+    # Load the pre-trained model for chat generation
+    model = AutoModelForCausalLM.from_pretrained(BASE_MODEL)
+
+    # Wrap the pre-trained model with PEFT for fine-tuning
+    model = PeftModel.from_pretrained(model, ADAPTER_MODEL, revision=adapter_commit()).to(device)
+
+    if backend == "int8":
+        # Fold the LoRA weights into the base model, then quantize every linear layer to int8
+        model = model.merge_and_unload()
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+
+    # Load the tokenizer for the pre-trained model
+    tokenizer = AutoTokenizer.from_pretrained(
+        BASE_MODEL,
+        add_bos_token=True,  # Add beginning of sequence token
+        trust_remote_code=True  # Trust remote code (if necessary)
+    )
+
+    # Cached past_key_values of the few-shot preamble
+    prefix_cache = inference.build_prefix_cache(model, tokenizer) if PREFIX_CACHE else None
+
+    return {"model": model, "tokenizer": tokenizer, "prefix_cache": prefix_cache}
+
+# Process-wide model instance shared by every Streamlit session
+llama = ModelRegistry("TinyLlama", load_model)
+
+# Persistent cache of query-understanding results
+query_cache = QueryCache(revision=lambda: f"{BASE_MODEL}|{ADAPTER_MODEL}@{adapter_commit()}|early_stop={EARLY_STOP}|{BACKEND}")
+
+def is_parsed(result):
+    """
+    Check whether a query-understanding result can be used, i.e. is an information dict that
+    at least names the file content; truncated generations can yield partial dicts.
+
+    Args:
+        result (object): The result of the model.
+
+    Returns:
+        bool: True if the result is usable.
+    """
+    return isinstance(result, dict) and bool(result.get('file content'))
+
+def get_llama_inference(query, wait=True, log=True):
+    """
+    Get inference from the TinyLLaMA model, answering repeated queries from the cache.
 
     Args:
         query (str): Input text query.
+        wait (bool, optional): Wait for the model to load on a cache miss. Defaults to True.
+        log (bool, optional): Append the query to the query log. Defaults to True.
 
     Returns:
-        str: Generated response from the model.
+        dict: The extracted information, or None if the model could not parse the query, or if `wait`
+            is False and the model is not ready yet.
     """
-    result = inference.inference(model, tokenizer, query)
+    from inference import inference
+
+    if log:
+        log_query(query)
+    result = query_cache.get(query)
+    if result is None:
+        if not wait and not llama.ready:
+            llama.start()
+            return None
+        loaded = llama.get()
+        result = inference.inference(loaded["model"], loaded["tokenizer"], query, prefix_cache=loaded["prefix_cache"], early_stop=EARLY_STOP)
+        if is_parsed(result):
+            # Parse failures are not cached, so the query is retried next time
+            query_cache.put(query, result)
     return result
@@ -2,6 +2,165 @@ import os
 from datetime import datetime, timezone
 from pathlib import Path
 
+# File type of each suffix handled by the importers
+FILE_TYPES = {
+    '.jpg': 'image',
+    '.pdf': 'pdf',
+    '.mp4': 'video',
+    '.csv': 'csv',
+}
+
+
+class FileTable:
+    """Columnar table of file metadata: path, size in bytes, ctime, mtime (POSIX timestamps) and type."""
+
+    COLUMNS = ("path", "size", "ctime", "mtime", "type")
+
+    def __init__(self):
+        self.columns = {column: [] for column in self.COLUMNS}
+        self.index = {}  # Path string -> row number
+
+    def append(self, path, size, ctime, mtime, file_type):
+        """
+        Add a file to the table.
+
+        Args:
+            path (Path): Path to the file.
+            size (int): Size in bytes.
+            ctime (float): Creation (or metadata change) time.
+            mtime (float): Modification time.
+            file_type (str): Type of the file, see FILE_TYPES.
+        """
+        self.index[str(path)] = len(self.columns["path"])
+        for column, value in zip(self.COLUMNS, (Path(path), size, ctime, mtime, file_type)):
+            self.columns[column].append(value)
+
+    def __len__(self):
+        return len(self.columns["path"])
+
+    def __contains__(self, path):
+        return str(path) in self.index
+
+    def discard(self, path):
+        """
+        Drop a file from the table, e.g. because it changed since the scan.
+
+        Args:
+            path (Path): Path to the file.
+        """
+        self.index.pop(str(path), None)
+
+    def row(self, path):
+        """
+        Return the metadata of one file.
+
+        Args:
+            path (Path): Path to the file.
+
+        Returns:
+            dict: Column -> value, or None if the file is not in the table.
+        """
+        i = self.index.get(str(path))
+        if i is None:
+            return None
+        return {column: values[i] for column, values in self.columns.items()}
+
+    def paths(self, file_type=None, directory=None):
+        """
+        Select files by type and parent directory.
+
+        Args:
+            file_type (str, optional): Only files of this type. Defaults to all types.
+            directory (Path, optional): Only files directly inside this directory. Defaults to anywhere.
+
+        Returns:
+            list: The paths, sorted.
+        """
+        directory = Path(os.path.relpath(directory)) if directory is not None else None
+        selected = [path for path, t in zip(self.columns["path"], self.columns["type"])
+                    if (file_type is None or t == file_type) and (directory is None or path.parent == directory)
+                    and str(path) in self.index]
+        return sorted(selected)
+
+    def total_size(self, paths):
+        """
+        Sum the sizes of some files of the table.
+
+        Args:
+            paths (list): Paths of files in the table.
+
+        Returns:
+            int: Their total size in bytes.
+        """
+        sizes = self.columns["size"]
+        return sum(sizes[self.index[str(path)]] for path in paths if str(path) in self.index)
+
+
+# Table of the last scan, shared by the importers and the manifest of the same process
+file_table = FileTable()
+
+
+def scan_files(root="data", share=True):
+    """
+    Walk a directory tree once with os.scandir and collect the metadata of every supported file,
+    reusing the stat information cached by each directory entry.
+
+    Args:
+        root (Path, optional): The directory to scan. Defaults to 'data'.
+        share (bool, optional): Make the result the process-wide `file_table`. Defaults to True.
+
+    Returns:
+        FileTable: The metadata of the files found.
+    """
+    global file_table
+    table = FileTable()
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                file_type = FILE_TYPES.get(os.path.splitext(entry.name)[1].lower())
+                if file_type is None or not entry.is_file():
+                    continue
+                stats = entry.stat()
+                table.append(Path(os.path.relpath(entry.path)), stats.st_size, stats.st_ctime, stats.st_mtime, file_type)
+    if share:
+        file_table = table
+    return table
+
+
+def file_stat(path, fresh=False):
+    """
+    Return the size and times of a file, from the shared table if it was scanned, otherwise with os.stat.
+
+    Args:
+        path (Path): Path to the file.
+        fresh (bool, optional): Always stat the file, e.g. when pairing the result with its content.
+            Defaults to False.
+
+    Returns:
+        dict: "size" in bytes, "ctime" and "mtime" as POSIX timestamps.
+    """
+    row = None if fresh else file_table.row(Path(os.path.relpath(path)))
+    if row is not None:
+        return {"size": row["size"], "ctime": row["ctime"], "mtime": row["mtime"]}
+    stats = os.stat(path)
+    return {"size": stats.st_size, "ctime": stats.st_ctime, "mtime": stats.st_mtime}
+
+
+def invalidate(path):
+    """
+    Forget the scanned metadata of a file that changed, so that it is read from disk again.
+
+    Args:
+        path (Path): Path to the file.
+    """
+    file_table.discard(Path(os.path.relpath(path)))
+
 
 def timeConvert(atime):
     """
@@ -41,14 +200,12 @@ def createFileRecords(somepath):
     Returns:
         dict: A dictionary containing file attributes.
     """
-    firstDict = {}
-    
-    stats = os.stat(somepath)
+    stats = file_stat(somepath)
     attrs = {
-        'Size (KB)': sizeFormat(stats.st_size),
-        'Creation Date': timeConvert(stats.st_ctime),
-        'Modified Date': timeConvert(stats.st_mtime),
-        'Last Access Date': timeConvert(stats.st_atime),   
+        'Size (bytes)': stats["size"],
+        'Size (KB)': sizeFormat(stats["size"]),
+        'Creation Date': timeConvert(stats["ctime"]),
+        'Modified Date': timeConvert(stats["mtime"]),
     }
     
     return attrs 
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from scripts.get_metadata import file_stat
+
+# Location of the ingestion manifest
+MANIFEST_PATH = Path(".cache/manifest.json")
+
+# Lock file serializing manifest writes of add_data, the app and the watcher
+LOCK_PATH = Path(".cache/manifest.lock")
+
+# Digests remembered per process, so the manifest and the blob store read each file once
+HASH_CACHE_SIZE = 4096
+
+# Counter bumped after every ingestion, used to invalidate cached search results
+GENERATION_PATH = Path(".cache/ingest_generation")
+
+
+def read_generation(path=GENERATION_PATH):
+    """
+    Read the ingestion generation.
+
+    Args:
+        path (Path, optional): Path to the counter file. Defaults to GENERATION_PATH.
+
+    Returns:
+        int: The number of ingestions recorded so far.
+    """
+    try:
+        return int(Path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_generation(path=GENERATION_PATH):
+    """
+    Increment the ingestion generation.
+
+    Args:
+        path (Path, optional): Path to the counter file. Defaults to GENERATION_PATH.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(str(read_generation(path) + 1))
+    os.replace(tmp, path)
+
+
+@contextmanager
+def file_lock(path=LOCK_PATH):
+    """
+    Hold an exclusive lock on a file, shared between processes.
+
+    Args:
+        path (Path, optional): Path to the lock file. Defaults to LOCK_PATH.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+_hashes = OrderedDict()  # (path, size, mtime) -> hex digest
+_hashes_lock = Lock()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 of a file without loading it into memory. The digest is remembered
+    for as long as the file keeps its size and mtime, so a file is hashed once per ingestion.
+
+    Args:
+        path (Path): Path to the file.
+        chunk_size (int, optional): Bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        str: The hex digest.
+    """
+    stats = os.stat(path)
+    key = (os.path.abspath(path), stats.st_size, stats.st_mtime_ns)
+    with _hashes_lock:
+        if key in _hashes:
+            _hashes.move_to_end(key)
+            return _hashes[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    with _hashes_lock:
+        _hashes[key] = digest.hexdigest()
+        while len(_hashes) > HASH_CACHE_SIZE:
+            _hashes.popitem(last=False)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Records the size, mtime and content hash of every ingested file, per collection.
+    Several processes may update the manifest file; each keeps track of its own changes and
+    merges them into the current file contents when it saves.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        """
+        Load the manifest, or start an empty one.
+
+        Args:
+            path (Path, optional): Path to the manifest file. Defaults to MANIFEST_PATH.
+        """
+        self.path = Path(path)
+        self.lock_path = self.path.with_suffix(".lock")
+        self.entries = self._read()
+        self.pending = {}  # Stat and hash computed by `diff`, committed by `record`
+        self.updates = {}  # (collection, path) -> entry, or None if removed, since the last save
+        self.resets = set()  # Collections reset since the last save
+
+    def _read(self):
+        return json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def _merge(self, entries):
+        """Apply the unsaved changes of this process to manifest entries read from disk."""
+        for collection in self.resets:
+            entries.pop(collection, None)
+        for (collection, key), entry in self.updates.items():
+            if entry is None:
+                entries.get(collection, {}).pop(key, None)
+            else:
+                entries.setdefault(collection, {})[key] = entry
+        return entries
+
+    def reload(self):
+        """Pick up the changes saved by other processes, keeping the unsaved changes of this one."""
+        with file_lock(self.lock_path):
+            self.entries = self._merge(self._read())
+
+    def hashes(self):
+        """
+        Return the content hash of every file in the manifest, including those saved by other processes.
+
+        Returns:
+            set: The hex digests.
+        """
+        self.reload()
+        return {entry["hash"] for files in self.entries.values() for entry in files.values()}
+
+    def _stat(self, path, fresh=False):
+        stats = file_stat(path, fresh)
+        return {"size": stats["size"], "mtime": stats["mtime"]}
+
+    def changes(self, collection, paths):
+        """
+        Find which of the given files are new or changed. Files whose size and mtime are
+        unchanged are not read; the others are hashed to tell real changes from touched files.
+
+        Args:
+            collection (str): The collection the files belong to.
+            paths (list): Paths of existing files.
+
+        Returns:
+            tuple: Lists of new and changed paths.
+        """
+        known = self.entries.get(collection, {})
+        new, changed = [], []
+        for path in paths:
+            key = str(path)
+            entry = self._stat(path)
+            old = known.get(key)
+            if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+                continue
+            # Stored with the hash, so read the current state rather than the scanned one
+            entry = self._stat(path, fresh=True)
+            entry["hash"] = file_hash(path)
+            self.pending[(collection, key)] = entry
+            if old is None:
+                new.append(path)
+            elif old["hash"] != entry["hash"]:
+                changed.append(path)
+            else:
+                # Touched but identical: only refresh the stat
+                self.record(collection, path)
+        return new, changed
+
+    def __contains__(self, item):
+        collection, path = item
+        return str(path) in self.entries.get(collection, {})
+
+    def diff(self, collection, paths):
+        """
+        Compare the files on disk with the manifest.
+
+        Args:
+            collection (str): The collection the files belong to.
+            paths (list): Paths of all the files currently on disk.
+
+        Returns:
+            tuple: Lists of new, changed and removed paths.
+        """
+        new, changed = self.changes(collection, paths)
+        on_disk = {str(path) for path in paths}
+        removed = [Path(key) for key in self.entries.get(collection, {}) if key not in on_disk]
+        return new, changed, removed
+
+    def record(self, collection, path):
+        """
+        Mark a file as ingested in its current state.
+
+        Args:
+            collection (str): The collection the file belongs to.
+            path (Path): Path to the file.
+        """
+        key = str(path)
+        entry = self.pending.pop((collection, key), None)
+        if entry is None:
+            entry = self._stat(path, fresh=True)
+            entry["hash"] = file_hash(path)
+        self.entries.setdefault(collection, {})[key] = entry
+        self.updates[(collection, key)] = entry
+
+    def remove(self, collection, path):
+        """
+        Forget a file.
+
+        Args:
+            collection (str): The collection the file belonged to.
+            path (Path): Path to the file.
+        """
+        self.entries.get(collection, {}).pop(str(path), None)
+        self.updates[(collection, str(path))] = None
+
+    def reset(self, collection):
+        """
+        Forget every file of a collection, e.g. after it was re-created.
+
+        Args:
+            collection (str): The collection name.
+        """
+        self.entries.pop(collection, None)
+        self.resets.add(collection)
+        self.updates = {k: v for k, v in self.updates.items() if k[0] != collection}
+
+    def save(self):
+        """
+        Merge the changes of this process into the manifest file under the lock, write it
+        atomically and bump the ingestion generation.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            self.entries = self._merge(self._read())
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.entries, indent=1))
+            os.replace(tmp, self.path)
+            bump_generation(self.path.parent / GENERATION_PATH.name)
+        self.updates = {}
+        self.resets = set()
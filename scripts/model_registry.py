@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+
+class ModelRegistry:
+    """Loads a model once per process in a background thread and exposes its readiness."""
+
+    NOT_LOADED = "not loaded"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, name, loader):
+        """
+        Initialize the registry without loading anything.
+
+        Args:
+            name (str): Name of the model, used in log messages.
+            loader (callable): Function without arguments returning the loaded model.
+        """
+        self.name = name
+        self.loader = loader
+        self.status = self.NOT_LOADED
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.loaded = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self):
+        """Whether the model is loaded and usable."""
+        return self.status == self.READY
+
+    def start(self):
+        """Start loading the model in the background. Does nothing if loading has already started."""
+        with self.lock:
+            if self.status != self.NOT_LOADED:
+                return
+            self.status = self.LOADING
+        threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True).start()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            self.value = self.loader()
+            self.load_seconds = time.perf_counter() - start
+            self.status = self.READY
+            logging.info(f"{self.name} loaded in {self.load_seconds:.1f}s")
+        except Exception as e:
+            self.error = e
+            self.status = self.FAILED
+            logging.error(f"Loading {self.name} failed: {e}")
+        finally:
+            self.loaded.set()
+
+    def get(self, timeout=None):
+        """
+        Return the model, starting and waiting for the load if necessary.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the load. Defaults to waiting forever.
+
+        Returns:
+            object: The loaded model.
+        """
+        self.start()
+        if not self.loaded.wait(timeout):
+            raise TimeoutError(f"{self.name} is still loading")
+        if self.status == self.FAILED:
+            raise RuntimeError(f"Loading {self.name} failed: {self.error}")
+        return self.value
@@ -0,0 +1,366 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from scripts.batch_writer import BATCH_BYTES, BATCH_SIZE, insert_batch, object_size
+from scripts.manifest import Manifest
+
+# Objects and payload bytes buffered between the pipelines and the writer; producers block when it is full
+QUEUE_SIZE = 256
+QUEUE_BYTES = 128 * 1024 * 1024
+
+# Seconds a producer waits for room in the queue before checking that the writer is still alive
+PUT_TIMEOUT = 5.0
+
+# Pipelines producing objects at the same time
+MAX_PIPELINES = 3
+
+# Worker processes shared by the CPU-bound parsers (PDF text extraction)
+CPU_WORKERS = 4
+
+# Marks the end of a pipeline in the queue
+_DONE = object()
+
+
+class ObjectQueue:
+    """FIFO queue bounded by both its number of items and the payload bytes they hold."""
+
+    def __init__(self, max_items=QUEUE_SIZE, max_bytes=QUEUE_BYTES):
+        """
+        Args:
+            max_items (int, optional): Maximum number of items. Defaults to QUEUE_SIZE.
+            max_bytes (int, optional): Maximum payload bytes; a single larger item is still accepted
+                into an empty queue. Defaults to QUEUE_BYTES.
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = deque()
+        self.bytes = 0
+        self.condition = threading.Condition()
+
+    def put(self, item, size=0, timeout=None):
+        """
+        Append an item, blocking while the queue is full.
+
+        Args:
+            item (object): The item.
+            size (int, optional): Its payload size in bytes. Defaults to 0.
+            timeout (float, optional): Seconds to wait for room. Defaults to waiting forever.
+
+        Returns:
+            bool: True if the item was queued, False if the timeout expired.
+        """
+        def has_room():
+            return not self.items or (len(self.items) < self.max_items and self.bytes + size <= self.max_bytes)
+
+        with self.condition:
+            if not self.condition.wait_for(has_room, timeout):
+                return False
+            self.items.append((item, size))
+            self.bytes += size
+            self.condition.notify_all()
+            return True
+
+    def get(self):
+        """
+        Remove the oldest item, blocking until there is one.
+
+        Returns:
+            object: The item.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.items)
+            item, size = self.items.popleft()
+            self.bytes -= size
+            self.condition.notify_all()
+            return item
+
+
+def load_pipelines(data_dir="data", cpu_workers=CPU_WORKERS, fast=None):
+    """
+    Describe the ingestion pipeline of each modality.
+
+    Args:
+        data_dir (Path, optional): The data directory. Defaults to 'data'.
+        cpu_workers (int, optional): Worker processes for PDF parsing. Defaults to CPU_WORKERS.
+        fast (bool, optional): Read PDF abstracts from the text layer rather than the layout,
+            see `extract_pdf_record`. Defaults to PDF_FAST.
+
+    Returns:
+        dict: Modality -> pipeline, with the collection, the directory and type of its files, the
+            function defining the collection, its child collections, a function turning files into
+            (collection, data object) pairs, and its batch limits.
+    """
+    from create_collections.Images import define_collection_images, iter_image_objects
+    from create_collections.PDF import PDF_FAST, PDF_PASSAGES, define_collection_pdfs, iter_pdf_objects
+    from create_collections.PDFPassages import define_collection_pdf_passages, iter_passage_objects
+    from create_collections.Videos import (VIDEO_BATCH_BYTES, VIDEO_BATCH_SIZE, define_collection_videos,
+                                           iter_video_objects)
+    from scripts.passages import PASSAGE_COLLECTION
+
+    def image_objects(files, failures):
+        for data_obj in iter_image_objects(files=files, failures=failures):
+            yield 'images', data_obj
+
+    def pdf_objects(files, failures):
+        for data_obj in iter_pdf_objects(files, cpu_workers, PDF_FAST if fast is None else fast, failures=failures):
+            yield 'pdf', data_obj
+        if PDF_PASSAGES:
+            for data_obj in iter_passage_objects(files, cpu_workers, failures):
+                yield PASSAGE_COLLECTION, data_obj
+
+    def video_objects(files, failures):
+        for data_obj in iter_video_objects(files=files, failures=failures):
+            yield 'videos', data_obj
+
+    data_dir = Path(data_dir)
+    return {
+        "images": {"collection": "images", "directory": data_dir / "images", "type": "image",
+                   "define": define_collection_images, "children": {}, "objects": image_objects,
+                   "batch_size": BATCH_SIZE, "batch_bytes": BATCH_BYTES},
+        "pdf": {"collection": "pdf", "directory": data_dir / "pdf", "type": "pdf",
+                "define": define_collection_pdfs,
+                "children": {PASSAGE_COLLECTION: define_collection_pdf_passages} if PDF_PASSAGES else {},
+                "objects": pdf_objects, "batch_size": BATCH_SIZE, "batch_bytes": BATCH_BYTES},
+        "videos": {"collection": "videos", "directory": data_dir / "videos", "type": "video",
+                   "define": define_collection_videos, "children": {}, "objects": video_objects,
+                   "batch_size": VIDEO_BATCH_SIZE, "batch_bytes": VIDEO_BATCH_BYTES},
+    }
+
+
+class IngestionOrchestrator:
+    """
+    Runs the pipelines of several modalities concurrently. Each pipeline parses and vectorizes its
+    files and puts the resulting objects on a shared bounded queue, which a single writer drains
+    into Weaviate in batches.
+    """
+
+    def __init__(self, client, manifest: Manifest, pipelines, queue_size=QUEUE_SIZE, max_pipelines=MAX_PIPELINES,
+                 queue_bytes=QUEUE_BYTES):
+        """
+        Args:
+            client (WeaviateClient): The Weaviate client.
+            manifest (Manifest): The ingestion manifest, updated once every pipeline is done.
+            pipelines (dict): The pipelines to run, see `load_pipelines`.
+            queue_size (int, optional): Capacity of the object queue, in objects. Defaults to QUEUE_SIZE.
+            max_pipelines (int, optional): Pipelines producing at the same time. Defaults to MAX_PIPELINES.
+            queue_bytes (int, optional): Capacity of the object queue, in payload bytes. Defaults to QUEUE_BYTES.
+        """
+        self.client = client
+        self.manifest = manifest
+        self.pipelines = pipelines
+        self.queue = ObjectQueue(queue_size, queue_bytes)
+        self.max_pipelines = max_pipelines
+        self.writer = None
+        self.writer_error = None
+        self.stats = {name: {"files": 0, "bytes": 0, "objects": 0, "failed": 0, "failed_files": set(),
+                             "errors": [], "start": None, "end": None} for name in pipelines}
+
+    def prepare(self, name, paths, incremental=False):
+        """
+        Create or clean up the collections of a pipeline and find the files it has to import.
+
+        Args:
+            name (str): The pipeline name.
+            paths (list): Paths of the pipeline's files currently on disk.
+            incremental (bool, optional): Only import new and changed files. Defaults to False.
+
+        Returns:
+            list: The files to import.
+        """
+        from scripts.add_data import apply_changes, can_sync, recreate_collection
+
+        pipeline = self.pipelines[name]
+        collection_name = pipeline["collection"]
+        if incremental and can_sync(self.client, collection_name):
+            new, changed, removed = self.manifest.diff(collection_name, paths)
+            print(f"{name}: {len(new)} new, {len(changed)} changed, {len(removed)} removed files.")
+            for child, define_child in pipeline["children"].items():
+                if not self.client.collections.exists(child):
+                    define_child(self.client, child, collection_name)
+            # Deletions only; the new and changed files go through the pipeline and are recorded by `run`
+            apply_changes(self.client, collection_name, None, new, changed, removed, self.manifest)
+            return new + changed
+
+        # Full ingestion: re-create the collections from every file
+        recreate_collection(self.client, collection_name, pipeline["define"], self.manifest)
+        for child, define_child in pipeline["children"].items():
+            define_child(self.client, child, collection_name)
+        return list(paths)
+
+    def put(self, item, size=0):
+        """
+        Queue an item for the writer, blocking while the queue is full.
+
+        Args:
+            item (tuple): (pipeline name, collection name, data object).
+            size (int, optional): Payload size of the object in bytes. Defaults to 0.
+
+        Raises:
+            RuntimeError: If the writer stopped, so that nothing will ever drain the queue.
+        """
+        while not self.queue.put(item, size, timeout=PUT_TIMEOUT):
+            if not self.writer.is_alive():
+                raise RuntimeError(f"The writer stopped: {self.writer_error}")
+
+    def produce(self, name, files):
+        """
+        Run one pipeline and queue its objects, blocking while the queue is full.
+
+        Args:
+            name (str): The pipeline name.
+            files (list): The files to import.
+        """
+        stats = self.stats[name]
+        failures = []
+        try:
+            for collection_name, data_obj in self.pipelines[name]["objects"](files, failures):
+                self.put((name, collection_name, data_obj), object_size(data_obj))
+        except Exception as e:
+            logging.error(f"Pipeline '{name}' failed: {e}")
+            stats["errors"].append(str(e))
+            stats["failed_files"].update(path.name for path in files)
+        finally:
+            stats["failed_files"].update(failures)
+            try:
+                self.put((name, None, _DONE))
+            except RuntimeError:
+                pass
+
+    def write(self, running):
+        """
+        Drain the queue into Weaviate until every pipeline is done. Objects are grouped per
+        pipeline and collection into batches bounded by the pipeline's limits. An error stops
+        the writer and is kept in `writer_error`, which makes the producers give up.
+
+        Args:
+            running (int): Number of pipelines that will put objects on the queue.
+        """
+        try:
+            self._write(running)
+        except Exception as e:
+            logging.error(f"Writer failed: {e}")
+            self.writer_error = e
+
+    def _write(self, running):
+        buffers = {}  # (pipeline, collection) -> [objects, bytes]
+
+        def flush(key):
+            batch, _ = buffers.pop(key, ([], 0))
+            if not batch:
+                return
+            name, collection_name = key
+            inserted, errors = insert_batch(self.client.collections.get(collection_name), batch)
+            stats = self.stats[name]
+            stats["objects"] += inserted
+            stats["failed"] += len(errors)
+            for data_obj, message in errors:
+                filename = data_obj.properties.get("filename")
+                stats["failed_files"].add(filename)
+                stats["errors"].append(f"{filename}: {message}")
+
+        while running:
+            name, collection_name, data_obj = self.queue.get()
+            if data_obj is _DONE:
+                for key in [key for key in buffers if key[0] == name]:
+                    flush(key)
+                self.stats[name]["end"] = time.time()
+                running -= 1
+                continue
+
+            pipeline = self.pipelines[name]
+            key = (name, collection_name)
+            size = object_size(data_obj)
+            buffer = buffers.get(key)
+            if buffer and (len(buffer[0]) >= pipeline["batch_size"] or buffer[1] + size > pipeline["batch_bytes"]):
+                flush(key)
+            buffer = buffers.setdefault(key, [[], 0])
+            buffer[0].append(data_obj)
+            buffer[1] += size
+
+    def run(self, paths_by_pipeline, files_table=None, incremental=False):
+        """
+        Ingest the files of every pipeline and record them in the manifest.
+
+        Args:
+            paths_by_pipeline (dict): Pipeline name -> paths of its files on disk.
+            files_table (FileTable, optional): Metadata of the files, used for the byte counts. Defaults to None.
+            incremental (bool, optional): Only import new and changed files. Defaults to False.
+
+        Returns:
+            dict: Pipeline name -> throughput report, see `report`.
+        """
+        todo = {name: self.prepare(name, paths, incremental) for name, paths in paths_by_pipeline.items()}
+        todo = {name: files for name, files in todo.items() if files}
+
+        for name, files in todo.items():
+            stats = self.stats[name]
+            stats["files"] = len(files)
+            stats["bytes"] = files_table.total_size(files) if files_table is not None else \
+                sum(path.stat().st_size for path in files)
+
+        self.writer = threading.Thread(target=self.write, args=(len(todo),), name="ingest-writer")
+        self.writer.start()
+        with ThreadPoolExecutor(max_workers=self.max_pipelines, thread_name_prefix="ingest") as pool:
+            for name, files in todo.items():
+                def start(name=name, files=files):
+                    self.stats[name]["start"] = time.time()
+                    self.produce(name, files)
+
+                pool.submit(start)
+        try:
+            self.writer.join()
+            if self.writer_error is not None:
+                # Nothing is recorded in the manifest, so the next run retries every file
+                raise RuntimeError(f"Ingestion failed: {self.writer_error}") from self.writer_error
+
+            for name, files in todo.items():
+                failed = self.stats[name]["failed_files"]
+                for path in files:
+                    if path.name not in failed:
+                        self.manifest.record(self.pipelines[name]["collection"], path)
+        finally:
+            # Keep the resets, removals and whatever was recorded even if the ingestion failed
+            self.manifest.save()
+        return self.report()
+
+    def report(self):
+        """
+        Summarize the throughput of every pipeline, from its start to its last write.
+
+        Returns:
+            dict: Pipeline name -> files, MB, vectors, failures, seconds, files/s, MB/s and vectors/s.
+        """
+        report = {}
+        for name, stats in self.stats.items():
+            if stats["start"] is None:
+                continue
+            seconds = max((stats["end"] or time.time()) - stats["start"], 1e-9)
+            report[name] = {
+                "files": stats["files"],
+                "MB": stats["bytes"] / 1e6,
+                "vectors": stats["objects"],
+                "failed_files": len(stats["failed_files"]),
+                "seconds": seconds,
+                "files/s": stats["files"] / seconds,
+                "MB/s": stats["bytes"] / 1e6 / seconds,
+                "vectors/s": stats["objects"] / seconds,
+            }
+        return report
+
+
+def print_throughput(report):
+    """
+    Print the throughput report of an orchestrated ingestion.
+
+    Args:
+        report (dict): Output of `IngestionOrchestrator.report`.
+    """
+    print(f"{'modality':<10}{'files':>8}{'MB':>10}{'vectors':>10}{'failed':>8}{'s':>9}"
+          f"{'files/s':>10}{'MB/s':>9}{'vectors/s':>11}")
+    for name, r in report.items():
+        print(f"{name:<10}{r['files']:>8}{r['MB']:>10.1f}{r['vectors']:>10}{r['failed_files']:>8}{r['seconds']:>9.1f}"
+              f"{r['files/s']:>10.2f}{r['MB/s']:>9.2f}{r['vectors/s']:>11.2f}")
@@ -0,0 +1,87 @@
+from scripts.fusion import SearchHit
+
+# Child collection holding the passages of the documents in the 'pdf' collection
+PASSAGE_COLLECTION = "pdf_passages"
+
+# Words per passage and words shared by consecutive passages. The ImageBind text encoder reads at
+# most 77 tokens, so longer passages would only be vectorized up to their first ~60 words.
+PASSAGE_WORDS = 60
+PASSAGE_OVERLAP = 15
+
+# Passages shown under each document in the results
+TOP_PASSAGES = 3
+
+
+def split_passages(pages, words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP):
+    """
+    Split the text of a document into overlapping passages that may span page breaks.
+
+    Args:
+        pages (list): The text of each page, in order.
+        words (int, optional): Words per passage. Defaults to PASSAGE_WORDS.
+        overlap (int, optional): Words shared by consecutive passages. Defaults to PASSAGE_OVERLAP.
+
+    Yields:
+        dict: The passage index, its text and its first and last page numbers (1-based).
+    """
+    tokens = [(word, number) for number, text in enumerate(pages, 1) for word in (text or "").split()]
+    step = max(words - overlap, 1)
+    for index, start in enumerate(range(0, max(len(tokens) - overlap, 1), step)):
+        window = tokens[start:start + words]
+        if not window:
+            break
+        yield {
+            "passage_index": index,
+            "text": " ".join(word for word, _ in window),
+            "page_start": window[0][1],
+            "page_end": window[-1][1],
+        }
+
+
+def aggregate_passages(hits, collection="pdf", top_passages=TOP_PASSAGES):
+    """
+    Turn passage hits into document hits. A document scores as its best passage and keeps
+    its best passages as highlights.
+
+    Args:
+        hits (list): SearchHits of passages, best first.
+        collection (str, optional): The collection the documents belong to. Defaults to 'pdf'.
+        top_passages (int, optional): Highlights kept per document. Defaults to TOP_PASSAGES.
+
+    Returns:
+        list: One SearchHit per document, best first.
+    """
+    documents = {}
+    for hit in hits:
+        filename = hit.properties.get("filename")
+        document = documents.get(filename)
+        if document is None:
+            # The best passage stands for the document; its properties include the document's metadata
+            document = documents[filename] = SearchHit(hit.obj, collection, hit.score, dict(hit.ranks))
+        if len(document.highlights) < top_passages:
+            document.highlights.append(hit.properties)
+    return list(documents.values())
+
+
+def merge_documents(document_hits, passage_hits):
+    """
+    Merge the hits of the document collection with the document hits aggregated from passages.
+    Documents found both ways appear once, with the better score and the passage highlights, so
+    documents without passages (e.g. scanned PDFs) are still found through their own vectors.
+
+    Args:
+        document_hits (list): SearchHits of the document collection.
+        passage_hits (list): Output of `aggregate_passages`.
+
+    Returns:
+        list: One SearchHit per document, best first.
+    """
+    documents = {hit.properties.get("filename"): hit for hit in document_hits}
+    for hit in passage_hits:
+        filename = hit.properties.get("filename")
+        document = documents.get(filename)
+        if document is None or hit.score > document.score:
+            documents[filename] = hit
+        else:
+            document.highlights = hit.highlights
+    return sorted(documents.values(), key=lambda h: h.score, reverse=True)
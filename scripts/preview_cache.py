@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from threading import Lock, get_ident
+
+# Where previews are stored and how much disk they may use
+PREVIEW_DIR = Path(".cache/previews")
+MAX_BYTES = 512 * 1024 * 1024
+
+# Bounding box of the generated previews
+THUMBNAIL_SIZE = (320, 320)
+
+
+class PreviewCache:
+    """Small JPEG previews of images, PDFs and videos, stored on disk with an LRU size cap."""
+
+    def __init__(self, root=PREVIEW_DIR, max_bytes=MAX_BYTES, size=THUMBNAIL_SIZE):
+        """
+        Initialize the cache and measure its current size.
+
+        Args:
+            root (Path, optional): Directory holding the previews. Defaults to PREVIEW_DIR.
+            max_bytes (int, optional): Size cap; least recently used previews are evicted. Defaults to MAX_BYTES.
+            size (tuple, optional): Bounding box of the previews in pixels. Defaults to THUMBNAIL_SIZE.
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.size = size
+        self.lock = Lock()
+        self.total_bytes = sum(f.stat().st_size for f in self.root.glob("*.jpg"))
+
+    def _preview_path(self, path, at):
+        # Key on the file's identity and state, so edited files get a new preview
+        stats = os.stat(path)
+        key = f"{Path(path).resolve()}|{stats.st_size}|{stats.st_mtime}|{at}"
+        return self.root / (hashlib.sha1(key.encode()).hexdigest() + ".jpg")
+
+    def get(self, path, at=0):
+        """
+        Return the preview of a file, generating it on first use.
+
+        Args:
+            path (Path): The original file.
+            at (float, optional): Timestamp in seconds of the video frame to use. Defaults to 0.
+
+        Returns:
+            Path: The preview image, or None if no preview could be generated.
+        """
+        preview = self._preview_path(path, at)
+        if preview.exists():
+            # Refresh the access time used for LRU eviction
+            os.utime(preview)
+            return preview
+
+        # Render to a private file and move it into place, so other sessions never see a partial preview
+        tmp = preview.with_name(f"{preview.stem}.{os.getpid()}.{get_ident()}.jpg.tmp")
+        try:
+            self._render(Path(path), tmp, at)
+            os.replace(tmp, preview)
+        except Exception as e:
+            logging.warning(f"No preview for {path}: {e}")
+            tmp.unlink(missing_ok=True)
+            return None
+
+        with self.lock:
+            self.total_bytes += preview.stat().st_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+        return preview
+
+    def _render(self, path, preview, at):
+        suffix = path.suffix.lower()
+        if suffix in (".jpg", ".jpeg", ".png"):
+            from PIL import Image
+            with Image.open(path) as img:
+                img.thumbnail(self.size)
+                img.convert("RGB").save(preview, "JPEG", quality=80)
+        elif suffix == ".pdf":
+            import pypdfium2 as pdfium
+            pdf = pdfium.PdfDocument(path)
+            try:
+                page = pdf[0]
+                scale = min(self.size[0] / page.get_width(), self.size[1] / page.get_height())
+                page.render(scale=scale).to_pil().convert("RGB").save(preview, "JPEG", quality=80)
+            finally:
+                pdf.close()
+        elif suffix == ".mp4":
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError("ffmpeg not found")
+            subprocess.run(
+                ["ffmpeg", "-loglevel", "error", "-y", "-ss", str(at), "-i", str(path), "-frames:v", "1",
+                 "-vf", f"scale={self.size[0]}:-2", "-f", "image2", "-c:v", "mjpeg", str(preview)],
+                check=True,
+            )
+        else:
+            raise ValueError(f"unsupported file type {suffix}")
+
+    def evict(self):
+        """Delete the least recently used previews until the cache is within its size cap."""
+        files = sorted(self.root.glob("*.jpg"), key=lambda f: f.stat().st_mtime)
+        self.total_bytes = sum(f.stat().st_size for f in files)
+        for f in files:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.total_bytes -= f.stat().st_size
+            f.unlink()
+
+
+# Process-wide preview cache shared by all sessions
+preview_cache = PreviewCache()
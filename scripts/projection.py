@@ -0,0 +1,132 @@
+import json
+import logging
+import time
+from threading import Lock
+
+import weaviate.classes as wvc
+
+# Metadata properties returned by default; media is loaded from disk by filename when a result is shown
+DEFAULT_PROPERTIES = {
+    'images': ["filename", "path", "content_hash", "date_created", "date_modified", "file_size", "author"],
+    'pdf': ["filename", "num_pages", "date_created", "date_modified", "file_size", "author"],
+    'pdf_passages': ["filename", "text", "page_start", "page_end", "date_created", "date_modified",
+                     "file_size", "author"],
+    'videos': ["filename", "path", "content_hash", "segment_index", "start_time", "end_time",
+               "date_created", "date_modified", "file_size", "author"],
+}
+
+# Property types never returned in search responses
+HEAVY_TYPES = (wvc.config.DataType.BLOB,)
+
+
+def response_bytes(objects):
+    """
+    Estimate the payload size of a search response by serializing its deserialized objects as JSON.
+    The actual gRPC payload is not exposed by the client, so this is an estimate of the transferred
+    size, not a measurement; it is meant to compare projections with each other.
+
+    Args:
+        objects (list): The objects of a Weaviate query response.
+
+    Returns:
+        int: The estimated number of bytes of the returned properties and vectors.
+    """
+    size = 0
+    for o in objects:
+        size += len(json.dumps(o.properties, default=str))
+        if getattr(o, "vector", None):
+            size += len(json.dumps(o.vector))
+    return size
+
+
+class ResultProjection:
+    """
+    Chooses which properties a search returns. Properties of a heavy type (BLOBs) are never
+    returned, even if requested. The collection schemas are read once, so one instance should be
+    shared by all searches.
+    """
+
+    def __init__(self, client, defaults=DEFAULT_PROPERTIES):
+        """
+        Args:
+            client (WeaviateClient): The Weaviate client, used to read the collection schemas.
+            defaults (dict, optional): Collection -> default properties. Defaults to DEFAULT_PROPERTIES.
+        """
+        self.client = client
+        self.defaults = defaults
+        self.schemas = {}  # Collection -> {property name: data type}
+        self.lock = Lock()
+
+    def _schema(self, collection):
+        with self.lock:
+            if collection not in self.schemas:
+                try:
+                    config = self.client.collections.get(collection).config.get()
+                    self.schemas[collection] = {p.name: p.data_type for p in config.properties}
+                except Exception as e:
+                    logging.warning(f"Could not read the schema of {collection}: {e}")
+                    return None
+            return self.schemas[collection]
+
+    def properties(self, collection, include=()):
+        """
+        Return the properties a query on a collection should request.
+
+        Args:
+            collection (str): The collection name.
+            include (tuple, optional): Extra properties to return, e.g. 'abstract'. Defaults to ().
+
+        Returns:
+            list: The property names, or None to let Weaviate return every non-BLOB property.
+        """
+        wanted = list(self.defaults.get(collection, [])) + [p for p in include if p not in self.defaults.get(collection, [])]
+        schema = self._schema(collection)
+        if schema is None:
+            return wanted or None
+        if not wanted:
+            wanted = list(schema)
+        return [p for p in wanted if p in schema and schema[p] not in HEAVY_TYPES]
+
+
+class ResponseMeter:
+    """Records the estimated size and the duration of the responses of one search."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.last = {}  # Label -> {"objects", "bytes", "seconds"} of the last query
+
+    def measure(self, label, query, *args, **kwargs):
+        """
+        Run a query and record the estimated size and the duration of its response.
+
+        Args:
+            label (str): The key of the measurement, e.g. the collection name.
+            query (callable): The query method, e.g. `collection_obj.query.bm25`.
+            *args, **kwargs: Arguments of the query.
+
+        Returns:
+            QueryReturn: The query response.
+        """
+        start = time.perf_counter()
+        response = query(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        size = response_bytes(response.objects)
+        with self.lock:
+            self.last[label] = {"objects": len(response.objects), "bytes": size, "seconds": seconds}
+        logging.info(f"{label}: {len(response.objects)} objects, ~{size / 1024:.1f} KiB in {seconds * 1000:.0f} ms")
+        return response
+
+    def reset(self):
+        """Forget the measurements, e.g. before a new search."""
+        with self.lock:
+            self.last.clear()
+
+    def summary(self):
+        """
+        Return the measurements of the last query with each label.
+
+        Returns:
+            dict: Label -> {"objects", "bytes" (estimated), "seconds"}.
+        """
+        with self.lock:
+            return dict(self.last)
@@ -0,0 +1,244 @@
+import argparse
+import json
+import sqlite3
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+from scripts.query_embedding import normalize_query
+
+# Location of the on-disk cache
+CACHE_PATH = Path(".cache/query_cache.sqlite")
+
+# Log of every query sent to the LLM, used to warm up the cache
+QUERY_LOG = Path(".cache/query_log.txt")
+
+# Size above which the log is trimmed to its most recent QUERY_LOG_LINES queries
+QUERY_LOG_BYTES = 2 * 1024 * 1024
+QUERY_LOG_LINES = 10000
+
+# Eviction limits
+MAX_ENTRIES = 10000
+TTL_SECONDS = 7 * 24 * 3600
+
+
+class QueryCache:
+    """Disk-backed cache of query-understanding results with size and TTL eviction."""
+
+    def __init__(self, path=CACHE_PATH, revision="", max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        """
+        Initialize the cache, creating the database if necessary.
+
+        Args:
+            path (Path, optional): Path to the SQLite database. Defaults to CACHE_PATH.
+            revision (str or callable, optional): Model/adapter revision; entries of other revisions never match.
+                A callable is evaluated on the first lookup, e.g. to resolve it over the network. Defaults to "".
+            max_entries (int, optional): Maximum number of entries kept. Defaults to MAX_ENTRIES.
+            ttl (float, optional): Seconds after which an entry expires. Defaults to TTL_SECONDS.
+        """
+        self.path = Path(path)
+        self._revision = revision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "query TEXT, revision TEXT, value TEXT, created REAL, last_used REAL, "
+                "PRIMARY KEY (query, revision))"
+            )
+            # Lookup counters shared by every process using the cache
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+
+    @property
+    def revision(self):
+        """The model/adapter revision, resolved once if it was given as a callable."""
+        if callable(self._revision):
+            with self.lock:
+                if callable(self._revision):
+                    self._revision = self._revision()
+        return self._revision
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection to the cache database, commit on success and close it."""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, query):
+        """
+        Look up a query.
+
+        Args:
+            query (str): The user query.
+
+        Returns:
+            object: The cached result, or None on a miss.
+        """
+        key, revision = normalize_query(query), self.revision
+        now = time.time()
+        with self.lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE query = ? AND revision = ? AND created > ?",
+                (key, revision, now - self.ttl),
+            ).fetchone()
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?",
+                         ("misses" if row is None else "hits",))
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE cache SET last_used = ? WHERE query = ? AND revision = ?",
+                (now, key, revision),
+            )
+        return json.loads(row[0])
+
+    def put(self, query, value):
+        """
+        Store the result for a query and evict expired and least recently used entries.
+
+        Args:
+            query (str): The user query.
+            value (object): A JSON-serializable result.
+        """
+        key, revision = normalize_query(query), self.revision
+        now = time.time()
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, revision, json.dumps(value), now, now),
+            )
+            conn.execute("DELETE FROM cache WHERE created <= ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM cache WHERE rowid IN "
+                "(SELECT rowid FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __contains__(self, query):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM cache WHERE query = ? AND revision = ? AND created > ?",
+                (normalize_query(query), self.revision, time.time() - self.ttl),
+            ).fetchone()
+        return row is not None
+
+    def clear(self):
+        """Remove every entry from the cache and reset the lookup counters."""
+        with self.lock, self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+            conn.execute("UPDATE counters SET value = 0")
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        Returns:
+            dict: Entry count, and hits, misses and hit rate of every process since the last clear.
+        """
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits, misses = counters["hits"], counters["misses"]
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+def log_query(query, log_path=QUERY_LOG, max_bytes=QUERY_LOG_BYTES, max_lines=QUERY_LOG_LINES):
+    """
+    Append a query to the query log, trimming the log to its most recent queries once it grows too large.
+
+    Args:
+        query (str): The user query.
+        log_path (Path, optional): Path to the log file. Defaults to QUERY_LOG.
+        max_bytes (int, optional): Size above which the log is trimmed. Defaults to QUERY_LOG_BYTES.
+        max_lines (int, optional): Queries kept when trimming. Defaults to QUERY_LOG_LINES.
+    """
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "a") as f:
+        f.write(" ".join(query.split()) + "\n")
+        size = f.tell()
+    if size > max_bytes:
+        lines = log_path.read_text().splitlines(keepends=True)[-max_lines:]
+        tmp = log_path.with_suffix(".tmp")
+        tmp.write_text("".join(lines))
+        os.replace(tmp, log_path)
+
+
+def read_query_log(log_path):
+    """
+    Read queries from a log, either a text file with one query per line or a JSON
+    list of {"input": ...} records like fine_tune/data/query_test.json.
+
+    Args:
+        log_path (Path): Path to the log.
+
+    Returns:
+        list: The queries, most frequent first.
+    """
+    log_path = Path(log_path)
+    if log_path.suffix == ".json":
+        with open(log_path, "r") as f:
+            queries = [record["input"] for record in json.load(f)]
+    else:
+        queries = [line.strip() for line in log_path.read_text().splitlines() if line.strip()]
+
+    counts = Counter(normalize_query(q) for q in queries)
+    return [q for q, _ in counts.most_common()]
+
+
+def warm_up(log_path, top=None):
+    """
+    Pre-populate the cache by running the LLM on the most frequent logged queries.
+
+    Args:
+        log_path (Path): Path to the query log.
+        top (int, optional): Only warm the `top` most frequent queries. Defaults to all.
+    """
+    from scripts.get_llama_inference import get_llama_inference, query_cache
+
+    queries = read_query_log(log_path)[:top]
+    todo = [q for q in queries if q not in query_cache]
+    print(f"{len(queries) - len(todo)} of {len(queries)} queries already cached.")
+    for i, query in enumerate(todo, 1):
+        print(f"[{i}/{len(todo)}] {query}")
+        # Not logged again, the query is already in the log
+        get_llama_inference(query, log=False)
+    print(query_cache.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the TinyLlama query-understanding cache.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm = subparsers.add_parser("warm", help="pre-populate the cache from a query log")
+    warm.add_argument("log", nargs="?", default=QUERY_LOG, help="query log (.txt, one query per line, or .json)")
+    warm.add_argument("--top", type=int, default=None, help="only warm the N most frequent queries")
+    subparsers.add_parser("stats", help="print the number of cached entries and the hit rate")
+    subparsers.add_parser("clear", help="remove every cached entry")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        warm_up(args.log, args.top)
+    elif args.command == "stats":
+        print(QueryCache().stats())
+    elif args.command == "clear":
+        QueryCache().clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import json
+import os
+import urllib.request
+from collections import OrderedDict
+from threading import BoundedSemaphore, Lock
+
+# Address of the multi2vec-bind inference container (exposed on the host by docker-compose)
+BIND_INFERENCE_API = os.environ.get("BIND_INFERENCE_API", "http://localhost:8081")
+
+# Number of query embeddings kept in memory
+CACHE_SIZE = 1024
+
+# Requests a process sends to the inference container at the same time, so that concurrent
+# ingestion pipelines queue here instead of overloading the model server
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("BIND_MAX_CONCURRENT_REQUESTS", 2))
+_request_slots = BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+
+def normalize_query(text):
+    """
+    Normalize query text so that trivially different spellings share a cache entry.
+    The ImageBind text tokenizer lower-cases its input, so this does not change the vector.
+
+    Args:
+        text (str): The query text.
+
+    Returns:
+        str: The lower-cased text with collapsed whitespace.
+    """
+    return " ".join(text.lower().split())
+
+
+def vectorize(payload, url=BIND_INFERENCE_API + "/vectorize", timeout=10):
+    """
+    Send one vectorization request to the multi2vec-bind container.
+
+    Args:
+        payload (dict): Lists of inputs by modality, e.g. {"texts": [...], "images": [base64, ...]}.
+        url (str, optional): The vectorize endpoint. Defaults to the one of BIND_INFERENCE_API.
+        timeout (float, optional): Request timeout in seconds. Defaults to 10.
+
+    Returns:
+        dict: The response, e.g. {"textVectors": [...], "imageVectors": [...]}.
+    """
+    body = json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with _request_slots, urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def embed_media(images=(), videos=(), timeout=300):
+    """
+    Embed base64-encoded images and videos in one request, as Weaviate does when it vectorizes
+    the BLOB properties of an object. Used at ingestion when media is stored by reference.
+
+    Args:
+        images (list, optional): Base64-encoded images. Defaults to ().
+        videos (list, optional): Base64-encoded video clips. Defaults to ().
+        timeout (float, optional): Request timeout in seconds; video inference is slow. Defaults to 300.
+
+    Returns:
+        tuple: The image vectors and the video vectors, in input order.
+    """
+    payload = {}
+    if images:
+        payload["images"] = list(images)
+    if videos:
+        payload["video"] = list(videos)
+    response = vectorize(payload, timeout=timeout)
+    return response.get("imageVectors") or [], response.get("videoVectors") or []
+
+
+class QueryEmbedder:
+    """Computes ImageBind text vectors through the multi2vec-bind container, with an LRU cache."""
+
+    def __init__(self, url=BIND_INFERENCE_API, cache_size=CACHE_SIZE, timeout=10):
+        """
+        Initialize the embedder.
+
+        Args:
+            url (str, optional): Base URL of the multi2vec-bind inference API. Defaults to BIND_INFERENCE_API.
+            cache_size (int, optional): Maximum number of cached vectors. Defaults to CACHE_SIZE.
+            timeout (float, optional): Request timeout in seconds. Defaults to 10.
+        """
+        self.url = url.rstrip("/") + "/vectorize"
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.cache = OrderedDict()
+        self.lock = Lock()
+
+    def _vectorize(self, texts):
+        """
+        Send one batched vectorization request to the inference container.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One vector per text.
+        """
+        return vectorize({"texts": texts}, self.url, self.timeout)["textVectors"]
+
+    def embed_texts(self, texts):
+        """
+        Embed several texts, vectorizing only the ones missing from the cache in a single request.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One vector per text, in input order.
+        """
+        keys = [normalize_query(t) for t in texts]
+        with self.lock:
+            found = {k: self.cache[k] for k in keys if k in self.cache}
+            for k in found:
+                self.cache.move_to_end(k)
+
+        todo = list(dict.fromkeys(k for k in keys if k not in found))
+        if todo:
+            vectors = self._vectorize(todo)
+            with self.lock:
+                for k, v in zip(todo, vectors):
+                    found[k] = v
+                    self.cache[k] = v
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        return [found[k] for k in keys]
+
+
+# Process-wide embedder so the cache survives Streamlit reruns
+_embedder = QueryEmbedder()
+
+
+def embed_texts(texts):
+    """
+    Embed several texts with the shared process-wide embedder.
+
+    Args:
+        texts (list): The texts to embed.
+
+    Returns:
+        list: One vector per text, in input order.
+    """
+    return _embedder.embed_texts(texts)
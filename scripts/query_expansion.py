@@ -0,0 +1,67 @@
+from scripts.fusion import raw_score
+from scripts.query_embedding import embed_texts, normalize_query
+
+# How the synonyms extracted by TinyLlama are searched: "concurrent" runs one vector search per
+# synonym and keeps the best score of each object, "centroid" runs a single search with their mean
+EXPANSION_MODE = "concurrent"
+
+# Maximum number of synonyms searched per query
+MAX_SYNONYMS = 5
+
+
+def unique_synonyms(concepts, max_synonyms=MAX_SYNONYMS):
+    """
+    Drop empty and duplicate synonyms, keeping the order given by the model.
+
+    Args:
+        concepts (str or list): The query text, or the synonyms extracted by TinyLlama.
+        max_synonyms (int, optional): Maximum number of synonyms kept. Defaults to MAX_SYNONYMS.
+
+    Returns:
+        list: The distinct synonyms.
+    """
+    concepts = [concepts] if isinstance(concepts, str) else [str(c) for c in concepts]
+    unique = {}
+    for c in concepts:
+        if normalize_query(c):
+            unique.setdefault(normalize_query(c), c)
+    return list(unique.values())[:max_synonyms]
+
+
+def expansion_vectors(concepts, mode=EXPANSION_MODE):
+    """
+    Embed all synonyms in a single request to the inference container.
+
+    Args:
+        concepts (str or list): The query text, or the synonyms extracted by TinyLlama.
+        mode (str, optional): "concurrent" or "centroid". Defaults to EXPANSION_MODE.
+
+    Returns:
+        list: One query vector per synonym, or only their centroid.
+    """
+    vectors = embed_texts(unique_synonyms(concepts))
+    if mode == "centroid" and len(vectors) > 1:
+        return [[sum(values) / len(vectors) for values in zip(*vectors)]]
+    return vectors
+
+
+def merge_expansions(rankings):
+    """
+    Merge the results of the per-synonym searches of one collection. Objects found by several
+    synonyms appear once, with the best of their scores.
+
+    Args:
+        rankings (list): One list of response objects per synonym.
+
+    Returns:
+        list: The distinct response objects, best first.
+    """
+    if len(rankings) == 1:
+        return list(rankings[0])
+    best = {}
+    for objects in rankings:
+        for obj in objects:
+            kept = best.get(obj.uuid)
+            if kept is None or raw_score(obj) > raw_score(kept):
+                best[obj.uuid] = obj
+    return sorted(best.values(), key=raw_score, reverse=True)
@@ -0,0 +1,98 @@
+import calendar
+from datetime import datetime, timezone
+
+import weaviate.classes as wvc
+
+# Collection holding each file type the TinyLlama parser may predict
+FILE_TYPE_COLLECTIONS = {
+    'jpg': 'images', 'jpeg': 'images', 'png': 'images', 'heif': 'images', 'tiff': 'images',
+    'pdf': 'pdf', 'doc': 'pdf', 'docx': 'pdf', 'pptx': 'pdf', 'xls': 'pdf', 'xlsx': 'pdf',
+    'mp4': 'videos', 'mov': 'videos', 'avi': 'videos',
+}
+
+def parse_date(text):
+    """
+    Parse a YYYY-MM-DD date from the sort and filter inputs.
+
+    Args:
+        text (str): The date text.
+
+    Returns:
+        datetime: The date at midnight UTC.
+    """
+    return datetime.strptime(text, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+def llm_date_range(result, today=None):
+    """
+    Translate the 'year', 'month' and 'day' ranges extracted by TinyLlama into a date range.
+
+    Years are absolute (e.g. [2023, 2023]) or relative to the current year when not positive
+    (e.g. [-1, -1] for last year); [0, 0] alone means "the latest", which is not a range.
+    Months and days of 0 leave that part unconstrained.
+
+    Args:
+        result (dict): The information extracted by TinyLlama.
+        today (datetime, optional): Reference date for relative years. Defaults to now.
+
+    Returns:
+        tuple: (start, end) datetimes in UTC, or None if the query has no usable date range.
+    """
+    today = today or datetime.now(timezone.utc)
+    years, months, days = result.get('year'), result.get('month'), result.get('day')
+    if not isinstance(years, list) or len(years) != 2:
+        return None
+    y0, y1 = years
+    if y0 <= 0 and y1 <= 0:
+        if y0 == y1 == 0:
+            return None
+        y0, y1 = today.year + y0, today.year + y1
+
+    m0, m1 = months if isinstance(months, list) and len(months) == 2 and all(months) else (1, 12)
+    d0, d1 = days if isinstance(days, list) and len(days) == 2 and all(days) else (1, None)
+    try:
+        start = datetime(y0, m0, d0, tzinfo=timezone.utc)
+        end = datetime(y1, m1, d1 or calendar.monthrange(y1, m1)[1], 23, 59, 59, tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    return (start, end) if start <= end else None
+
+
+def collections_for_file_types(file_types, collections):
+    """
+    Restrict the searched collections to the ones holding the requested file types.
+
+    Args:
+        file_types (list): File types extracted by TinyLlama, e.g. ['pdf', 'docx'].
+        collections (list): The collections searched by default.
+
+    Returns:
+        list: The collections to search; all of them if no file type maps to one.
+    """
+    wanted = {FILE_TYPE_COLLECTIONS.get(str(t).lower().lstrip('.')) for t in file_types or []}
+    selected = [c for c in collections if c in wanted]
+    return selected or collections
+
+
+def date_filter(after=None, before=None):
+    """
+    Build a Weaviate filter on 'date_modified'.
+
+    Args:
+        after (datetime, optional): Earliest modification date. Defaults to None.
+        before (datetime, optional): Latest modification date. Defaults to None.
+
+    Returns:
+        Filter: The combined filter, or None if neither bound is given.
+    """
+    filters = []
+    if after is not None:
+        filters.append(wvc.query.Filter("date_modified").greater_or_equal(after))
+    if before is not None:
+        filters.append(wvc.query.Filter("date_modified").less_or_equal(before))
+    if not filters:
+        return None
+    combined = filters[0]
+    for f in filters[1:]:
+        combined = combined & f
+    return combined
@@ -0,0 +1,182 @@
+import argparse
+import json
+import logging
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+
+from scripts.get_llama_inference import is_parsed
+
+# Default address of the query-understanding service
+HOST = "127.0.0.1"
+PORT = 8765
+
+# Dynamic batching limits
+MAX_BATCH_SIZE = 8
+MAX_WAIT = 0.02  # Seconds to wait for more queries after the first one arrives
+
+
+class DynamicBatcher:
+    """Groups queries that arrive within a short window into one padded generate call."""
+
+    def __init__(self, infer_batch, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        """
+        Initialize the batcher and start its worker thread.
+
+        Args:
+            infer_batch (callable): Function taking a list of queries and returning one result per query.
+            max_batch_size (int, optional): Maximum number of queries per batch. Defaults to MAX_BATCH_SIZE.
+            max_wait (float, optional): Seconds to keep collecting after the first query. Defaults to MAX_WAIT.
+        """
+        self.infer_batch = infer_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name="batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, query):
+        """
+        Queue a query for the next batch.
+
+        Args:
+            query (str): The user query.
+
+        Returns:
+            Future: Resolves to the query's result.
+        """
+        future = Future()
+        self.queue.put((query, future))
+        return future
+
+    def _next_batch(self):
+        """Block for the first query, then collect more until the batch is full or the window closes."""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            queries = [query for query, _ in batch]
+            try:
+                results = self.infer_batch(queries)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            logging.info(f"Served a batch of {len(batch)} queries")
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class QueryRequestHandler(socketserver.StreamRequestHandler):
+    """Answers newline-delimited JSON requests of the form {"query": "..."}."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                query = json.loads(line)["query"]
+                result = self.server.parse(query)
+                reply = {"result": result}
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class QueryServer(socketserver.ThreadingTCPServer):
+    """Local socket server in front of the TinyLlama query parser."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, batcher, query_cache=None):
+        """
+        Args:
+            address (tuple): (host, port) to listen on.
+            batcher (DynamicBatcher): Batcher running the model.
+            query_cache (QueryCache, optional): Cache answered before the model is used. Defaults to None.
+        """
+        super().__init__(address, QueryRequestHandler)
+        self.batcher = batcher
+        self.query_cache = query_cache
+
+    def parse(self, query):
+        """
+        Parse a query, from the cache if possible, otherwise through the batcher.
+
+        Args:
+            query (str): The user query.
+
+        Returns:
+            object: The extracted meta information, or None if it could not be parsed.
+        """
+        if self.query_cache is not None:
+            result = self.query_cache.get(query)
+            if result is not None:
+                return result
+        result = self.batcher.submit(query).result()
+        if self.query_cache is not None and is_parsed(result):
+            self.query_cache.put(query, result)
+        return result
+
+
+def parse_query(query, host=HOST, port=PORT, timeout=60):
+    """
+    Ask the query-understanding service to parse a query.
+
+    Args:
+        query (str): The user query.
+        host (str, optional): Server host. Defaults to HOST.
+        port (int, optional): Server port. Defaults to PORT.
+        timeout (float, optional): Socket timeout in seconds. Defaults to 60.
+
+    Returns:
+        object: The extracted meta information.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps({"query": query}) + "\n").encode())
+        reply = json.loads(sock.makefile("r").readline())
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the TinyLlama query parser with dynamic batching.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT, help="batching window in seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from inference import inference
+    from scripts.get_llama_inference import llama, query_cache, log_query
+
+    loaded = llama.get()
+
+    def infer_batch(queries):
+        for query in queries:
+            log_query(query)
+        return inference.batch_inference(loaded["model"], loaded["tokenizer"], queries)
+
+    batcher = DynamicBatcher(infer_batch, args.max_batch_size, args.max_wait)
+    with QueryServer((args.host, args.port), batcher, query_cache) as server:
+        logging.info(f"Query server listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
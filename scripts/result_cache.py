@@ -0,0 +1,71 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+# Number of result lists kept per process
+MAX_ENTRIES = 256
+
+
+def make_key(mode, query, image_bytes, filters, generation):
+    """
+    Build the cache key of a search.
+
+    Args:
+        mode (str): The retrieval mode, e.g. 'BM25'.
+        query (str): The search text.
+        image_bytes (bytes): The uploaded query image, or None.
+        filters (tuple): The sort and filter options.
+        generation (int): The ingestion generation; any ingestion invalidates older keys.
+
+    Returns:
+        tuple: A hashable key.
+    """
+    image_hash = hashlib.sha1(image_bytes).hexdigest() if image_bytes else None
+    return (mode, " ".join(query.split()), image_hash, tuple(filters), generation)
+
+
+class ResultCache:
+    """Thread-safe LRU cache of ranked search results."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """
+        Args:
+            max_entries (int, optional): Maximum number of cached result lists. Defaults to MAX_ENTRIES.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        """
+        Look up the results of a search.
+
+        Args:
+            key (tuple): Output of `make_key`.
+
+        Returns:
+            list: The cached results, or None on a miss.
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, results):
+        """
+        Store the results of a search, evicting the least recently used entry if full.
+
+        Args:
+            key (tuple): Output of `make_key`.
+            results (list): The ranked results.
+        """
+        with self.lock:
+            self.entries[key] = results
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# Process-wide cache shared by all sessions
+result_cache = ResultCache()
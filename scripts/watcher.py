@@ -0,0 +1,262 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+from scripts.add_data import connect, apply_changes, ingest, schema_outdated
+from scripts.blob_store import blob_store
+from scripts.get_metadata import invalidate
+from scripts.manifest import Manifest
+
+# Seconds a file must stay quiet before it is ingested, so bursts of writes coalesce
+DEBOUNCE = 2.0
+
+# Maximum number of files ingested in one batch
+MAX_BATCH = 64
+
+# Where the watcher publishes its metrics for the ingestion page
+METRICS_PATH = Path(".cache/watcher_metrics.json")
+
+
+def load_routes(fast=None):
+    """
+    Map file suffixes to the collection, the data sub-directory and the create_collections
+    functions handling them, mirroring scripts/add_data.
+
+    Args:
+        fast (bool, optional): Read PDF abstracts from the text layer rather than the layout,
+            see `extract_pdf_record`. Defaults to PDF_FAST.
+
+    Returns:
+        dict: Suffix -> (collection name, sub-directory, define function, import function).
+    """
+    from create_collections.Images import define_collection_images, import_data_images
+    from create_collections.PDF import PDF_FAST, define_collection_pdfs, import_data_pdf
+    from create_collections.Videos import define_collection_videos, import_data_videos
+
+    return {
+        ".jpg": ("images", "images", define_collection_images, import_data_images),
+        ".pdf": ("pdf", "pdf", define_collection_pdfs,
+                 functools.partial(import_data_pdf, fast=PDF_FAST if fast is None else fast)),
+        ".mp4": ("videos", "videos", define_collection_videos, import_data_videos),
+    }
+
+
+class ChangeHandler(FileSystemEventHandler):
+    """Forwards file events to the watcher."""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        self.watcher.on_event(event.src_path)
+        if getattr(event, "dest_path", None):
+            self.watcher.on_event(event.dest_path)
+
+
+class IngestionWatcher:
+    """Watches the data directory and ingests changed files in debounced batches."""
+
+    def __init__(self, client, data_dir, routes, manifest: Manifest, debounce=DEBOUNCE, max_batch=MAX_BATCH):
+        """
+        Args:
+            client (WeaviateClient): The Weaviate client.
+            data_dir (Path): The directory to watch, recursively.
+            routes (dict): Output of `load_routes`.
+            manifest (Manifest): The ingestion manifest shared with scripts/add_data.
+            debounce (float, optional): Quiet time in seconds before a file is ingested. Defaults to DEBOUNCE.
+            max_batch (int, optional): Maximum number of files per batch. Defaults to MAX_BATCH.
+        """
+        self.client = client
+        self.data_dir = Path(os.path.relpath(data_dir))
+        self.routes = routes
+        self.manifest = manifest
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.pending = {}  # Path -> (first event time, last event time)
+        self.stats = {"events": 0, "ingested": 0, "deleted": 0, "failed": 0, "batches": 0,
+                      "last_batch_lag_s": None, "last_error": None, "in_progress": 0}
+
+    def on_event(self, src_path):
+        """
+        Record an event; repeated events for the same file are coalesced.
+
+        Args:
+            src_path (str): Path of the file the event is about.
+        """
+        path = Path(os.path.relpath(src_path))
+        # The metadata scanned at startup is stale from now on
+        invalidate(path)
+        route = self.routes.get(path.suffix.lower())
+        if route is None or path.parent != self.data_dir / route[1]:
+            return
+        now = time.time()
+        with self.lock:
+            first, _ = self.pending.get(path, (now, now))
+            self.pending[path] = (first, now)
+            self.stats["events"] += 1
+
+    def take_ready(self):
+        """
+        Remove and return the files that have been quiet for the debounce period.
+
+        Returns:
+            dict: Path -> time of its first event.
+        """
+        now = time.time()
+        with self.lock:
+            ready = [p for p, (_, last) in self.pending.items() if now - last >= self.debounce]
+            ready = sorted(ready, key=lambda p: self.pending[p][0])[:self.max_batch]
+            return {p: self.pending.pop(p)[0] for p in ready}
+
+    def process(self, ready):
+        """
+        Route a batch of files to their importers by type. A collection with an outdated schema is
+        re-created from every file of its directory instead.
+
+        Args:
+            ready (dict): Path -> time of its first event.
+        """
+        # scripts/add_data may have ingested files since the last batch
+        self.manifest.reload()
+        self.stats["in_progress"] = len(ready)
+        by_suffix = {}
+        for path in ready:
+            by_suffix.setdefault(path.suffix.lower(), []).append(path)
+
+        for suffix, paths in by_suffix.items():
+            collection_name, subdir, define_collection, import_data = self.routes[suffix]
+            try:
+                if not self.client.collections.exists(collection_name):
+                    define_collection(self.client, collection_name)
+                elif schema_outdated(self.client, collection_name):
+                    every = sorted(p for p in (self.data_dir / subdir).iterdir() if p.suffix.lower() == suffix)
+                    ingest(self.client, collection_name, define_collection, import_data, every, self.manifest)
+                    self.stats["ingested"] += len(every)
+                    continue
+                existing = [p for p in paths if p.exists()]
+                removed = [p for p in paths if not p.exists() and (collection_name, p) in self.manifest]
+                new, changed = self.manifest.changes(collection_name, existing)
+                report = apply_changes(self.client, collection_name, import_data, new, changed, removed, self.manifest)
+                failed = len(report.get("failed_objects", [])) if isinstance(report, dict) else 0
+                self.stats["ingested"] += len(new) + len(changed) - failed
+                self.stats["failed"] += failed
+                self.stats["deleted"] += len(removed)
+            except Exception as e:
+                logging.error(f"Ingesting {len(paths)} {suffix} files failed: {e}")
+                self.stats["failed"] += len(paths)
+                self.stats["last_error"] = str(e)
+
+        try:
+            # Drop the stored media of removed and changed files
+            blob_store.collect(self.manifest)
+        except OSError as e:
+            logging.warning(f"Collecting unreferenced blobs failed: {e}")
+
+        self.stats["in_progress"] = 0
+        self.stats["batches"] += 1
+        self.stats["last_batch_lag_s"] = time.time() - min(ready.values())
+
+    def metrics(self):
+        """
+        Return the watcher's metrics.
+
+        Returns:
+            dict: Queue depth, lag of the oldest pending file, files of the running batch, and counters.
+        """
+        now = time.time()
+        with self.lock:
+            depth = len(self.pending)
+            oldest = min((first for first, _ in self.pending.values()), default=None)
+        return {"queue_depth": depth, "lag_s": now - oldest if oldest else 0.0, "updated": now, **self.stats}
+
+    def publish_metrics(self, path=METRICS_PATH):
+        """Write the metrics to a JSON file read by the ingestion page."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.metrics()))
+        os.replace(tmp, path)
+
+    def run(self, polling=False, interval=0.5):
+        """
+        Watch the data directory until interrupted.
+
+        Args:
+            polling (bool, optional): Use the polling observer instead of inotify. Defaults to False.
+            interval (float, optional): Seconds between checks for ready files. Defaults to 0.5.
+        """
+        handler = ChangeHandler(self)
+        observer = PollingObserver() if polling else Observer()
+        observer.schedule(handler, str(self.data_dir), recursive=True)
+        try:
+            observer.start()
+        except OSError as e:
+            # e.g. inotify watch limit reached or unsupported filesystem
+            logging.warning(f"Native file events unavailable ({e}), falling back to polling")
+            observer = PollingObserver()
+            observer.schedule(handler, str(self.data_dir), recursive=True)
+            observer.start()
+        logging.info(f"Watching {self.data_dir} with {type(observer).__name__}")
+
+        # Metrics are published from their own thread so they stay fresh during long batches
+        stop = threading.Event()
+
+        def publish():
+            while not stop.is_set():
+                try:
+                    self.publish_metrics()
+                except OSError as e:
+                    logging.warning(f"Publishing metrics failed: {e}")
+                stop.wait(interval)
+
+        publisher = threading.Thread(target=publish, name="watcher-metrics", daemon=True)
+        publisher.start()
+        try:
+            while True:
+                ready = self.take_ready()
+                if ready:
+                    self.process(ready)
+                    logging.info(f"Batch done: {self.metrics()}")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            publisher.join()
+            observer.stop()
+            observer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuously ingest new and changed files.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE, help="quiet seconds before a file is ingested")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--polling", action="store_true", help="poll instead of using inotify")
+    parser.add_argument("--layout", action="store_true",
+                        help="find PDF abstracts by partitioning the page layout instead of reading the text layer")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = connect()
+    try:
+        watcher = IngestionWatcher(client, args.data_dir, load_routes(fast=not args.layout), Manifest(),
+                                   args.debounce, args.max_batch)
+        watcher.run(polling=args.polling)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()